@@ -0,0 +1,40 @@
+//  Time of drawing of the figures in the browser, sent to /metrics/redraw every few seconds
+//  (dashboard_redraw_* on /metrics)
+(function() {
+    var redraws = [];
+
+    function graphId(gd) {
+        var element = gd;
+        while (element && !element.id) {
+            element = element.parentElement;
+        }
+        return element ? element.id : 'unknown';
+    }
+
+    function timed(name, draw) {
+        return function(gd) {
+            var start = performance.now();
+            var result = draw.apply(this, arguments);
+            Promise.resolve(result).then(function() {
+                redraws.push({'graph': graphId(gd), 'kind': name, 'seconds': (performance.now() - start) / 1000});
+            });
+            return result;
+        };
+    }
+
+    //  plotly.js is loaded by the first graph
+    var wait = setInterval(function() {
+        if (window.Plotly && window.Plotly.react) {
+            window.Plotly.react = timed('react', window.Plotly.react);
+            window.Plotly.newPlot = timed('newPlot', window.Plotly.newPlot);
+            clearInterval(wait);
+        }
+    }, 100);
+
+    setInterval(function() {
+        if (redraws.length && navigator.sendBeacon) {
+            navigator.sendBeacon('/metrics/redraw', JSON.stringify(redraws));
+            redraws = [];
+        }
+    }, 5000);
+})();
@@ -0,0 +1,51 @@
+########################################################################################################################
+#
+#   Helpers of the benchmarks: loading dashboard.py without the server, memory of the process
+#
+########################################################################################################################
+import os
+import sys
+import importlib.util
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DASHBOARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dashboard.py')
+
+
+# ---------------------------------------------------------------------
+#   Load dashboard.py as a module (the server is not started)
+# ---------------------------------------------------------------------
+def load_dashboard(path=DASHBOARD):
+    #   Worker processes which parse the workbooks import it by name
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location('dashboard', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['dashboard'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------
+#   Memory of this process, MB
+# ---------------------------------------------------------------------
+def rss_mb():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def peak_rss_mb():
+    if resource is not None:
+        #   Linux gives KB, macOS gives bytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    return psutil.Process().memory_info().peak_wset / 2 ** 20
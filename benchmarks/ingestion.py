@@ -0,0 +1,91 @@
+########################################################################################################################
+#
+#   Benchmark of reading the workbooks: parse time and peak memory of every reader
+#
+#   Usage: python benchmarks/ingestion.py <Новый журнал по заявкам.xlsm> <График планового мониторинга.xlsx>
+#                                         [--dashboard <path to dashboard.py>]
+#          python benchmarks/ingestion.py --objects 100000 [--branches 20]
+#
+#   Without the files synthetic workbooks are made (and kept in benchmarks/data).
+#   Every reader runs in its own process: the peak memory of one reader does not hide the other.
+#
+########################################################################################################################
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import importlib.util
+import pandas as pd
+
+from common import DASHBOARD, load_dashboard, rss_mb, peak_rss_mb
+from synthetic import make_workbooks
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+READERS = ['openpyxl, all columns', 'openpyxl, needed columns', 'calamine, needed columns']
+
+
+def read(dashboard, reader, filename, sheet_name, skiprows):
+    engine, columns = reader.split(', ')
+    if columns == 'all columns':
+        #   As the workbooks were read before
+        return pd.read_excel(filename, sheet_name=sheet_name, skiprows=skiprows, engine=engine)
+    return dashboard.read_sheet(filename, sheet_name, skiprows, engine)
+
+
+def worker(args):
+    dashboard = load_dashboard(os.path.abspath(args.dashboard))
+    rss_before = rss_mb()
+
+    time_start = time.perf_counter()
+    df_new_jornal = read(dashboard, args.worker, args.jornal, 'Лист1', 6)
+    df_mon = read(dashboard, args.worker, args.mon, 'График', 0)
+    seconds = time.perf_counter() - time_start
+
+    print(json.dumps({'seconds': seconds, 'rss_before_mb': rss_before, 'peak_rss_mb': peak_rss_mb(),
+                      'columns': len(df_new_jornal.columns) + len(df_mon.columns),
+                      'frames_mb': (df_new_jornal.memory_usage(deep=True).sum()
+                                    + df_mon.memory_usage(deep=True).sum()) / 2 ** 20}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse time and peak memory of the workbook readers')
+    parser.add_argument('jornal', nargs='?', help='Новый журнал по заявкам.xlsm')
+    parser.add_argument('mon', nargs='?', help='График планового мониторинга.xlsx')
+    parser.add_argument('--objects', type=int, default=100000, help='size of the synthetic workbooks')
+    parser.add_argument('--branches', type=int, default=20)
+    parser.add_argument('--data', default=os.path.join(BENCHMARK_DIR, 'data'), help='folder of the workbooks')
+    parser.add_argument('--dashboard', default=DASHBOARD)
+    parser.add_argument('--worker', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    if not args.jornal or not args.mon:
+        args.jornal, args.mon = make_workbooks(args.objects, args.data, args.branches)
+    print("Journal:  " + args.jornal + " (" + format(os.path.getsize(args.jornal) / 2 ** 20, '.1f') + " MB)")
+    print("Plan:     " + args.mon + " (" + format(os.path.getsize(args.mon) / 2 ** 20, '.1f') + " MB)")
+    print("{:<26} {:>9} {:>8} {:>16} {:>12}".format('reader', 'time, s', 'columns', 'peak added, MB',
+                                                   'frames, MB'))
+
+    for reader in READERS:
+        if reader.startswith('calamine') and importlib.util.find_spec('python_calamine') is None:
+            print("{:<26} python-calamine is not installed".format(reader))
+            continue
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), os.path.abspath(args.jornal),
+                                  os.path.abspath(args.mon), '--dashboard', args.dashboard, '--worker', reader],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            print("{:<26} failed: {}".format(reader, process.stderr.strip().splitlines()[-1]))
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        print("{:<26} {:>9.2f} {:>8} {:>16.1f} {:>12.1f}".format(
+            reader, result['seconds'], result['columns'], result['peak_rss_mb'] - result['rss_before_mb'],
+            result['frames_mb']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+########################################################################################################################
+#
+#   Load test of a running dashboard: several users open the page at the same time
+#
+#   Usage: python benchmarks/load_test.py [--url http://localhost:8000] [--users 16] [--seconds 30]
+#                                         [--output result.json] [--baseline baseline.json]
+#
+#   Start the dashboard first: python dashboard.py (debug server) or python dashboard.py --production.
+#   A page view is the page and the callbacks the browser calls when the page is loaded (with the open tab),
+#   with the values of the layout; every user takes its own main filter. With --baseline requests/sec are compared
+#   with a saved run.
+#
+########################################################################################################################
+import os
+import json
+import time
+import argparse
+import platform
+import threading
+import urllib.request
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------------------------------------------------------------
+#   Requests of the page
+# ---------------------------------------------------------------------
+def get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def layout_values(component, values):
+    #   (id, property) -> value of every component with an id
+    if isinstance(component, list):
+        for item in component:
+            layout_values(item, values)
+    elif isinstance(component, dict):
+        props = component.get('props', {})
+        if isinstance(props.get('id'), str):
+            for name, value in props.items():
+                values[(props['id'], name)] = value
+        for value in props.values():
+            if isinstance(value, (list, dict)):
+                layout_values(value, values)
+    return values
+
+
+def page_callbacks(dependencies, values, main_filter):
+    #   Bodies of the callbacks which run on page load
+    values = dict(values)
+    values[('filter-dropdown', 'value')] = main_filter
+
+    #   The open tab asks the server for its content (by a callback in the browser)
+    request_id = str(values.get(('tabs', 'active_tab'))) + '-request'
+    values[(request_id, 'data')] = {'version': values.get(('snapshot-version', 'data')), 'main_filter': main_filter,
+                                    'year': values.get(('year-dropdown', 'value'))}
+    bodies = []
+    for dependency in dependencies:
+        requested = any(item['id'] == request_id for item in dependency['inputs'])
+        if dependency.get('clientside_function') or (dependency.get('prevent_initial_call') and not requested):
+            continue
+        output = dependency['output']
+        if output.startswith('..'):
+            outputs = [dict(zip(('id', 'property'), item.split('.'))) for item in output.strip('.').split('...')]
+        else:
+            outputs = dict(zip(('id', 'property'), output.split('.')))
+        inputs = [dict(item, value=values.get((item['id'], item['property']))) for item in dependency['inputs']]
+        state = [dict(item, value=values.get((item['id'], item['property']))) for item in dependency['state']]
+        bodies.append(json.dumps({'output': output, 'outputs': outputs, 'inputs': inputs, 'state': state,
+                                  'changedPropIds': []}).encode())
+    return bodies
+
+
+# ---------------------------------------------------------------------
+#   Users
+# ---------------------------------------------------------------------
+def user_loop(url, bodies, stop_time, result, lock):
+    latencies = []
+    size = 0
+    errors = 0
+    pages = 0
+    while time.perf_counter() < stop_time:
+        for body in [None] + bodies:
+            time_start = time.perf_counter()
+            try:
+                if body is None:
+                    request = urllib.request.Request(url + '/')
+                else:
+                    request = urllib.request.Request(url + '/_dash-update-component', data=body,
+                                                     headers={'Content-Type': 'application/json'})
+                with urllib.request.urlopen(request) as response:
+                    size += len(response.read())
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - time_start)
+        pages += 1
+    with lock:
+        result['latencies'].extend(latencies)
+        result['bytes'] += size
+        result['errors'] += errors
+        result['pages'] += pages
+
+
+def run(url, users, seconds):
+    values = layout_values(get_json(url + '/_dash-layout'), {})
+    dependencies = get_json(url + '/_dash-dependencies')
+    filters = [option['value'] for option in values.get(('filter-dropdown', 'options'), [])] or ['all']
+
+    result = {'latencies': [], 'bytes': 0, 'errors': 0, 'pages': 0}
+    lock = threading.Lock()
+    stop_time = time.perf_counter() + seconds
+    threads = [threading.Thread(target=user_loop, args=(url, page_callbacks(dependencies, values,
+                                                                            filters[user % len(filters)]),
+                                                        stop_time, result, lock))
+               for user in range(users)]
+    time_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - time_start
+
+    latencies = sorted(result['latencies'])
+    return {'users': users, 'seconds': elapsed, 'requests': len(latencies), 'pages': result['pages'],
+            'errors': result['errors'], 'requests_per_second': len(latencies) / elapsed,
+            'pages_per_second': result['pages'] / elapsed,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else None,
+            'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else None,
+            'mb_per_second': result['bytes'] / elapsed / 2 ** 20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of a running dashboard')
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--users', type=int, default=16, help='users at the same time')
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    print("Dashboard: {}, users: {}, {} s".format(url, args.users, args.seconds))
+    run_result = run(url, args.users, args.seconds)
+    print("    requests/sec   {:9.1f}".format(run_result['requests_per_second']))
+    print("    pages/sec      {:9.2f}".format(run_result['pages_per_second']))
+    print("    latency p50    {:9.4f} s".format(run_result['latency_p50'] or 0))
+    print("    latency p95    {:9.4f} s".format(run_result['latency_p95'] or 0))
+    print("    MB/sec         {:9.2f}".format(run_result['mb_per_second']))
+    print("    errors         {:9}".format(run_result['errors']))
+
+    result = {'meta': {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'url': url}, 'run': run_result}
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results',
+                                         'load_test_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, mode='w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print("Results are saved to " + output)
+
+    if args.baseline:
+        with open(args.baseline, mode='r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        print("Compared with the baseline of " + baseline['meta']['date'] + " (" + baseline['meta']['url'] + ")")
+        for name in ('requests_per_second', 'pages_per_second', 'latency_p50', 'latency_p95'):
+            old = baseline['run'].get(name)
+            if old:
+                print("    {:<20} {:9.4f}  x{:.2f}".format(name, run_result[name], run_result[name] / old))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+########################################################################################################################
+#
+#   Memory benchmark: peak RSS of a full make_calc() run
+#
+#   Usage: python benchmarks/memory_make_calc.py <Новый журнал по заявкам.xlsm> <График планового мониторинга.xlsx>
+#                                                [--dashboard <path to dashboard.py>]
+#
+#   To compare with an older version:
+#       git show <commit>:dashboard.py > old_dashboard.py
+#       python benchmarks/memory_make_calc.py journal.xlsm plan.xlsx --dashboard old_dashboard.py
+#
+########################################################################################################################
+import os
+import gc
+import time
+import argparse
+import tracemalloc
+import pandas as pd
+
+from common import DASHBOARD, load_dashboard, rss_mb, peak_rss_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory of a full make_calc() run')
+    parser.add_argument('jornal', help='Новый журнал по заявкам.xlsm')
+    parser.add_argument('mon', help='График планового мониторинга.xlsx')
+    parser.add_argument('--dashboard', default=DASHBOARD)
+    args = parser.parse_args()
+
+    dashboard = load_dashboard(os.path.abspath(args.dashboard))
+    dashboard.filename1 = args.jornal
+    dashboard.filename3 = args.mon
+
+    df_main_jornal = dashboard.load_main_jornal()
+    fingerprint = pd.util.hash_pandas_object(df_main_jornal).sum()
+    dtypes = df_main_jornal.dtypes.copy()
+    gc.collect()
+    rss_before = rss_mb()
+    peak_before = peak_rss_mb()
+
+    tracemalloc.start()
+    time_start = time.perf_counter()
+    dashboard.make_calc(df_main_jornal)
+    calc_time = time.perf_counter() - time_start
+    calc_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+
+    #   make_calc() must not change the frame it was given
+    untouched = dtypes.equals(df_main_jornal.dtypes) and fingerprint == pd.util.hash_pandas_object(df_main_jornal).sum()
+
+    print("Dashboard:                 " + os.path.abspath(args.dashboard))
+    print("Rows of the main journal:  " + str(len(df_main_jornal)))
+    print("Main journal in memory:    " + format(df_main_jornal.memory_usage(deep=True).sum() / 2 ** 20, '.1f') + " MB")
+    print("RSS before make_calc:      " + format(rss_before, '.1f') + " MB")
+    print("Peak RSS before make_calc: " + format(peak_before, '.1f') + " MB")
+    print("Peak RSS after make_calc:  " + format(peak_rss_mb(), '.1f') + " MB")
+    print("Peak allocated by make_calc (tracemalloc): " + format(calc_peak, '.1f') + " MB")
+    print("make_calc time:            " + format(calc_time, '.2f') + " s")
+    print("Input frame untouched:     " + str(untouched))
+
+
+if __name__ == '__main__':
+    main()
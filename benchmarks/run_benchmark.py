@@ -0,0 +1,187 @@
+########################################################################################################################
+#
+#   Benchmark of the dashboard on synthetic workbooks
+#
+#   Usage: python benchmarks/run_benchmark.py [--objects 10000 100000 1000000] [--branches 20] [--repeat 3]
+#                                             [--output result.json] [--baseline baseline.json]
+#
+#   Workbooks are made once and kept in benchmarks/data. Every stage is timed (the best of --repeat runs,
+#   loading is timed once), the results are saved to a JSON file. With --baseline each stage is compared
+#   with the saved run of the same size.
+#
+########################################################################################################################
+import os
+import json
+import time
+import platform
+import argparse
+import tempfile
+from datetime import date, datetime
+import pandas as pd
+import plotly.io.json as plotly_json
+
+from common import DASHBOARD, load_dashboard, peak_rss_mb
+from synthetic import make_workbooks
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------------------------------------------------------------
+#   Timing of stages
+# ---------------------------------------------------------------------
+def timed(times, name, repeat, func, *args):
+    result = None
+    best = None
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - time_start
+        best = elapsed if best is None else min(best, elapsed)
+    times[name] = best
+    print("    {:<28} {:9.4f} s".format(name, best))
+    return result
+
+
+def table_records(views, parts):
+    #   The tables which go to the browser
+    return [value.to_dict('records') for results in [views] + list(parts.values()) for calc in results.values()
+            for name, value in calc.items()
+            if isinstance(value, pd.DataFrame) and name not in ('df_main_jornal', 'df_main_jornal_completed')]
+
+
+def make_parts(dashboard, views):
+    #   Parts of all tabs, as if every tab was opened
+    parts = {}
+    for part in dashboard.PART_CALCS:
+        dashboard.make_part(views, parts, part)
+    return parts
+
+
+def run_size(dashboard, objects, branches, repeat, data_dir):
+    print("Objects: {}, branches: {}".format(objects, branches))
+    time_start = time.perf_counter()
+    filename_jornal, filename_mon = make_workbooks(objects, data_dir, branches)
+    print("    workbooks ready in {:.1f} s".format(time.perf_counter() - time_start))
+
+    dashboard.filename1 = filename_jornal
+    dashboard.filename3 = filename_mon
+    times = {}
+
+    #   Loading: both workbooks at once, then one by one (they stay in the source cache), then merge and types
+    sources = [(filename_jornal, dashboard.load_new_jornal), (filename_mon, dashboard.load_mon)]
+    timed(times, 'load_sources', 1, dashboard.load_sources, sources, False)
+    timed(times, 'load_new_jornal', 1, dashboard.load_cached, filename_jornal, dashboard.load_new_jornal)
+    timed(times, 'load_mon', 1, dashboard.load_cached, filename_mon, dashboard.load_mon)
+    feather = dashboard.feather
+    dashboard.feather = None
+    df_main_jornal = timed(times, 'merge', repeat, dashboard.load_main_jornal)
+    dashboard.feather = feather
+
+    #   Columnar cache of the main journal
+    if feather is not None:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            dashboard.JORNAL_CACHE_DIR = cache_dir
+            dashboard.JORNAL_CACHE_FILE = os.path.join(cache_dir, 'main_jornal.feather')
+            dashboard.JORNAL_CACHE_META = os.path.join(cache_dir, 'main_jornal.json')
+            stats = dashboard.sources_stat()
+            timed(times, 'jornal_cache_write', repeat, dashboard.write_jornal_cache, df_main_jornal, stats)
+            timed(times, 'jornal_cache_read', repeat, dashboard.read_jornal_cache, stats)
+
+    #   Calculations
+    year = str(date.today().year)
+    month = date.today().strftime("%m")
+    date_start = '01.01.' + year
+    date_end = '31.12.' + year
+    cube_state = timed(times, 'update_cube', repeat, dashboard.update_cube, None, df_main_jornal)
+    views = timed(times, 'make_calc', repeat, dashboard.make_calc, df_main_jornal, None, cube_state)
+    parts = timed(times, 'tab_parts', repeat, make_parts, dashboard, views)
+    calc = views['all']
+    df_completed = parts['completed']['all']['df_main_jornal_completed']
+
+    #   Plan, completed and expired by branches are slices of the cube
+    cube = cube_state['cube']
+    timed(times, 'cube_slices', repeat, lambda: (
+        dashboard.cube_counts(dashboard.cube_plan(cube), 'Филиал исполнитель ДМОД'),
+        dashboard.cube_counts(dashboard.cube_completed_planned(cube), 'Филиал исполнитель ДМОД'),
+        dashboard.cube_counts(dashboard.cube_expired(cube, month), 'Филиал исполнитель ДМОД', 'rows')))
+    timed(times, 'calc_expired', repeat, dashboard.calc_expired, calc['df_plan_year'], calc['df_compl_year'], month)
+    timed(times, 'calc_list_expired', repeat, dashboard.calc_list_expired, df_main_jornal, month)
+    timed(times, 'top_tables', repeat, lambda: (
+        dashboard.top_leaders(dashboard.count_in_period(df_completed, ['Ф.И.О. исполнителя'], date_start, date_end)),
+        dashboard.top_branches(dashboard.count_in_period(df_completed, ['Филиал Банка (рассмотрения заявки)'],
+                                                         date_start, date_end))))
+    timed(times, 'average_times', repeat, dashboard.average_times, df_completed, date_start, date_end)
+
+    #   Figures (of the header, the figures of the tabs are made with their parts) and what is sent to the browser
+    figures = timed(times, 'prepare_fig', repeat,
+                    lambda: [dashboard.prepare_fig(calc_temp, dashboard.colors) for calc_temp in views.values()])
+    figures += [{name: value for name, value in calc_temp.items() if name.startswith('fig_')}
+                for results in parts.values() for calc_temp in results.values()]
+    records = timed(times, 'to_dict_records', repeat, table_records, views, parts)
+    figures_json = timed(times, 'figures_to_json', repeat,
+                         lambda: [figure.to_json() for figures_temp in figures for figure in figures_temp.values()])
+
+    #   A change of the filter: the browser gets only the data of the figures it has
+    patches_json = timed(times, 'figure_patches', repeat,
+                         lambda: [plotly_json.to_json_plotly(dashboard.figure_patch(figure).to_plotly_json())
+                                  for figures_temp in figures for figure in figures_temp.values()])
+
+    print("    bytes per figure: {:.0f} full, {:.0f} update of the data".format(
+        sum(len(figure.encode()) for figure in figures_json) / len(figures_json),
+        sum(len(patch.encode()) for patch in patches_json) / len(patches_json)))
+
+    return {'objects': objects, 'branches': branches, 'rows': len(df_main_jornal),
+            'tables_bytes': len(json.dumps(records, default=str).encode()),
+            'figures_bytes': sum(len(figure.encode()) for figure in figures_json),
+            'figure_patches_bytes': sum(len(patch.encode()) for patch in patches_json), 'figures': len(figures_json),
+            'peak_rss_mb': peak_rss_mb(), 'stages': times}
+
+
+# ---------------------------------------------------------------------
+#   Comparison with a saved run
+# ---------------------------------------------------------------------
+def compare(result, baseline):
+    print("Compared with the baseline of " + baseline['meta']['date'])
+    for run in result['runs']:
+        old = next((run_temp for run_temp in baseline['runs'] if run_temp['objects'] == run['objects']
+                    and run_temp['branches'] == run['branches']), None)
+        if old is None:
+            continue
+        print("Objects: {}, branches: {}".format(run['objects'], run['branches']))
+        for name, elapsed in run['stages'].items():
+            if name in old['stages'] and old['stages'][name] > 0:
+                ratio = elapsed / old['stages'][name]
+                mark = '  <- slower' if ratio > 1.2 else ''
+                print("    {:<28} {:9.4f} s  x{:.2f}{}".format(name, elapsed, ratio, mark))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the dashboard on synthetic workbooks')
+    parser.add_argument('--objects', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--branches', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data', default=os.path.join(BENCHMARK_DIR, 'data'), help='folder of the workbooks')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--dashboard', default=DASHBOARD)
+    args = parser.parse_args()
+
+    dashboard = load_dashboard(os.path.abspath(args.dashboard))
+    result = {'meta': {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                       'pandas': pd.__version__, 'platform': platform.platform(), 'repeat': args.repeat},
+              'runs': [run_size(dashboard, objects, args.branches, args.repeat, args.data) for objects in args.objects]}
+
+    output = args.output or os.path.join(BENCHMARK_DIR, 'results',
+                                         'benchmark_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, mode='w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print("Results are saved to " + output)
+
+    if args.baseline:
+        with open(args.baseline, mode='r', encoding='utf-8') as file:
+            compare(result, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
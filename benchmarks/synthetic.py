@@ -0,0 +1,117 @@
+########################################################################################################################
+#
+#   Synthetic workbooks with the columns of
+#       График планового мониторинга 2023.xlsx (sheet "График") and
+#       Новый журнал по заявкам 2023.xlsm (sheet "Лист1", header in the 7th row)
+#
+#   Usage: python benchmarks/synthetic.py <number of objects> <directory> [--branches N] [--seed S]
+#
+########################################################################################################################
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import date
+
+MONTHS = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь',
+          'декабрь']
+BRANCHES = ['г. Алматы ГО', 'Алматы филиал', 'Астана', 'Шымкент', 'Караганда', 'Актобе', 'Тараз', 'Павлодар', 'Атырау',
+            'Костанай', 'Уральск', 'Кызылорда', 'Петропавловск', 'Кокшетау', 'Талдыкорган', 'Семей', 'Усть-Каменогорск',
+            'Актау', 'Туркестан', 'Жезказган']
+STATUSES = ['исполнено', 'не требует мониторинга', 'залоги высвобождены', 'Заключение подготовлено', 'согласовано',
+            'залог в г.Тараз', 'в работе']
+UNIQUENESS = ['Mass segment', 'Unique', 'Interval']
+
+
+def branch_names(number):
+    names = BRANCHES[:number]
+    return names + ['Филиал ' + str(i) for i in range(len(names) + 1, number + 1)]
+
+
+def durations(rng, size, missing):
+    seconds = pd.Series(rng.integers(0, 12 * 3600, size))
+    text = (seconds // 3600).astype(str).str.zfill(2) + ':' + (seconds // 60 % 60).astype(str).str.zfill(2) + ':' \
+        + (seconds % 60).astype(str).str.zfill(2)
+    return text.where(rng.random(size) >= missing)
+
+
+def make_frames(objects, branches=20, seed=1):
+    rng = np.random.default_rng(seed)
+    names = np.array(branch_names(branches), dtype=object)
+    months = np.array(MONTHS + [name.capitalize() for name in MONTHS], dtype=object)
+    employees = np.array(['Сотрудник ' + str(i) for i in range(1, 5 * branches + 1)], dtype=object)
+    codes = np.arange(100000, 100000 + objects)
+
+    #   Corrected month is set for a quarter of objects, status of monitoring for a half
+    corrected = pd.Series(rng.choice(months, objects)).where(rng.random(objects) < 0.25)
+    status = pd.Series(rng.choice(np.array(STATUSES, dtype=object), objects)).where(rng.random(objects) < 0.5)
+    df_mon = pd.DataFrame({
+        'Код объекта залога': codes,
+        'Наименование заемщика Сцепка': ['ТОО ' + str(code % 5000) for code in codes],
+        'Класс обеспечения': rng.choice(np.array(['Недвижимость', 'Транспорт', 'Оборудование'], dtype=object), objects),
+        'Наименование вида обеспечения': 'вид',
+        'Месторасположение (Адрес)': 'адрес',
+        'Стоимость НОК либо Банка': rng.random(objects) * 1e6,
+        'Филиал исполнитель ДМОД': rng.choice(names, objects),
+        'Статус залога 01.2023': rng.choice(np.array(['Принят к учету'] * 8 + ['Принят', 'Снят с учета'], dtype=object),
+                                            objects),
+        'График (месяц)': rng.choice(months, objects, p=[0.08] * 12 + [0.04 / 12] * 12),
+        'График скорректированный (месяц)': corrected,
+        'Статус ДМОД': status,
+        'Ф.И.О. исполнителя': rng.choice(employees, objects),
+        'Ф.И.О. согласующего': rng.choice(employees, objects),
+        'Дата заключения ДМОД ': pd.NaT})
+
+    #   Requests: none for a quarter of objects, two for some of them
+    request_codes = np.concatenate([codes[rng.random(objects) < 0.75], codes[rng.random(objects) < 0.1]])
+    requests = len(request_codes)
+    year_start = np.datetime64(str(date.today().year) + '-01-01')
+    closed = year_start + rng.integers(0, 365 * 24, requests).astype('timedelta64[h]')
+    df_new_jornal = pd.DataFrame({
+        ' ID залога': request_codes,
+        'Дата заключения УМОД': pd.Series(closed).where(rng.random(requests) >= 0.1),
+        'Цель составления заключения': 'мониторинг',
+        'Филиал Банка (рассмотрения заявки)': rng.choice(names, requests),
+        'Исполнитель': rng.choice(employees, requests),
+        'Согласующий Куратор': rng.choice(employees, requests),
+        'Согласующий Начальник отдела': 'Начальник отдела',
+        'Согласующий Начальник Управления': 'Начальник Управления',
+        'Уникальность обеспечения': rng.choice(np.array(UNIQUENESS, dtype=object), requests),
+        'Время затраченное на заключение Исполнителем': durations(rng, requests, 0.05),
+        'Время затраченное на согласование куратором': durations(rng, requests, 0.0),
+        'В срок/просрочка по нормативному времени исполнителя': 'в срок',
+        'В срок/просрочка по нормативному времени согласующего куратора': 'в срок'})
+    return df_mon, df_new_jornal
+
+
+def make_workbooks(objects, directory, branches=20, seed=1):
+    os.makedirs(directory, exist_ok=True)
+    filename_mon = os.path.join(directory, 'mon_{}_{}.xlsx'.format(objects, branches))
+    filename_jornal = os.path.join(directory, 'jornal_{}_{}.xlsx'.format(objects, branches))
+    if os.path.exists(filename_mon) and os.path.exists(filename_jornal):
+        return filename_jornal, filename_mon
+
+    #   Written under a temporary name: a stopped run does not leave a broken workbook
+    temp_mon = filename_mon.replace('.xlsx', '.tmp.xlsx')
+    temp_jornal = filename_jornal.replace('.xlsx', '.tmp.xlsx')
+
+    df_mon, df_new_jornal = make_frames(objects, branches, seed)
+    df_mon.to_excel(temp_mon, sheet_name='График', index=False)
+    with pd.ExcelWriter(temp_jornal) as writer:
+        #   Six rows of title above the header, as in the journal
+        pd.DataFrame([['Новый журнал по заявкам (синтетический)']]).to_excel(writer, sheet_name='Лист1', index=False,
+                                                                            header=False)
+        df_new_jornal.to_excel(writer, sheet_name='Лист1', index=False, startrow=6)
+    os.replace(temp_mon, filename_mon)
+    os.replace(temp_jornal, filename_jornal)
+    return filename_jornal, filename_mon
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Make synthetic workbooks')
+    parser.add_argument('objects', type=int)
+    parser.add_argument('directory')
+    parser.add_argument('--branches', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(make_workbooks(args.objects, args.directory, args.branches, args.seed))
@@ -4,87 +4,351 @@
 #   v.1.0
 #   Feb 01, 2023
 #
-#   Input: \\BCCFS-HQ\reserve_data\отчеты УКР ДКР\Филиалы\1. Мониторинг\4. Мониторинг 2023\
-#                                                                       График планового мониторинга 2023.xlsx,
+#   Input: \\BCCFS-HQ\reserve_data\отчеты УКР ДКР\Филиалы\1. Мониторинг\4. Мониторинг <year>\
+#                                                                       График планового мониторинга <year>.xlsx,
 #
-#          \\BCCFS-HQ\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Новый журнал по заявкам 2023.xlsm
+#          \\BCCFS-HQ\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Новый журнал по заявкам <year>.xlsm
+#
+#          The files of the earlier years are read once into the history (cache/history.sqlite)
 #
 #   Output: Dashboard
 #   IP & Port: localhost:8000
 #
 ########################################################################################################################
+import os
+import re
+import json
+import pickle
+import argparse
+import contextlib
+import time
+import queue
+import sqlite3
+import hashlib
+import functools
+import collections
+import multiprocessing
+import concurrent.futures
+import importlib.util
+import threading
 import numpy as np
 import pandas as pd
+import flask
 import dash
 from datetime import date, datetime
-from dash import dcc, html, dash_table, ctx
+from types import MappingProxyType
+from dash import dcc, html, dash_table, ctx, Patch
+import plotly.io as pio
 import plotly.express as px
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 import warnings
 
+#   pyarrow is optional: without it the workbooks are parsed on every start,
+#   and the parsed workbooks come from the worker processes by pickle
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+#   Production servers are optional: gunicorn (several processes, not on Windows) or waitress (threads)
+try:
+    import gunicorn.app.base as gunicorn_base
+except ImportError:
+    gunicorn_base = None
+try:
+    import waitress
+except ImportError:
+    waitress = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 #   Silent mode
 warnings.simplefilter(action='ignore', category=UserWarning)
-pd.options.mode.chained_assignment = None  # default='warn'
 
 
 # ---------------------------------------------------------------------
-#   Loading file content of Новый журнал по заявкам 2023.xlsm file
+#   Metrics: time and rows of the calculation stages, time and payload of callbacks
+#   (exported by the route /metrics)
+# ---------------------------------------------------------------------
+#   Set True to print one JSON line per callback
+METRICS_LOG_CALLBACKS = False
+
+#   name -> {'calls', 'seconds', 'last_seconds', 'rows_in', 'rows_out'}
+stage_metrics = {}
+#   name -> {'calls', 'prevented', 'seconds', 'last_seconds', 'bytes', 'last_bytes'}
+callback_metrics = {}
+#   graph -> {'calls', 'seconds', 'last_seconds'}, drawing of the figures in the browsers
+redraw_metrics = {}
+#   Graphs of the layout: the browsers may send anything, only these are counted
+REDRAW_GRAPHS = ['graph-main_plan_completed', 'graph-mass_unique_interval', 'graph-plan_compl_year',
+                 'graph-year-over-year', 'graph-top_filials', 'graph-plan-completed', 'graph-plan-completed-branch']
+metrics_lock = threading.Lock()
+
+
+def frame_rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(len(item) for item in value if isinstance(item, (pd.DataFrame, pd.Series)))
+    return 0
+
+
+def timed_stage(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        time_start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - time_start
+
+        rows_in = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), 0)
+        with metrics_lock:
+            metrics = stage_metrics.setdefault(func.__name__, {'calls': 0, 'seconds': 0.0, 'last_seconds': 0.0,
+                                                               'rows_in': 0, 'rows_out': 0})
+            metrics['calls'] += 1
+            metrics['seconds'] += seconds
+            metrics['last_seconds'] = seconds
+            metrics['rows_in'] += rows_in
+            metrics['rows_out'] += frame_rows(result)
+        return result
+    return wrapper
+
+
+def record_callback(name, seconds, size, prevented):
+    with metrics_lock:
+        metrics = callback_metrics.setdefault(name, {'calls': 0, 'prevented': 0, 'seconds': 0.0, 'last_seconds': 0.0,
+                                                     'bytes': 0, 'last_bytes': 0})
+        metrics['calls'] += 1
+        metrics['prevented'] += int(prevented)
+        metrics['seconds'] += seconds
+        metrics['last_seconds'] = seconds
+        metrics['bytes'] += size
+        metrics['last_bytes'] = size
+
+
+def record_redraw(graph, seconds):
+    if graph not in REDRAW_GRAPHS:
+        return
+    with metrics_lock:
+        metrics = redraw_metrics.setdefault(graph, {'calls': 0, 'seconds': 0.0, 'last_seconds': 0.0})
+        metrics['calls'] += 1
+        metrics['seconds'] += seconds
+        metrics['last_seconds'] = seconds
+
+
+# ---------------------------------------------------------------------
+#   Reading of a sheet: only the columns of the main dataframe, the text columns as text.
+#   python-calamine is optional (pandas 2.2 or newer): it reads workbooks several times faster than openpyxl
+# ---------------------------------------------------------------------
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') is not None else 'openpyxl'
+
+#   Columns of the main dataframe which are not text
+NOT_TEXT_COLUMNS = ['Код объекта залога', 'Стоимость НОК либо Банка', 'Дата заключения ДМОД ', 'Дата заключения УМОД',
+                    'Время затраченное на заключение Исполнителем', 'Время затраченное на согласование куратором']
+
+
+def needed_column(column):
+    return column in JORNAL_COLUMNS or column == ' ID залога' or str(column).startswith(STATUS_COLUMN_PREFIX)
+
+
+def read_sheet(filename, sheet_name, skiprows, engine=None):
+    return pd.read_excel(filename, sheet_name=sheet_name, skiprows=skiprows, engine=engine or EXCEL_ENGINE,
+                         usecols=needed_column,
+                         dtype={column: str for column in JORNAL_COLUMNS if column not in NOT_TEXT_COLUMNS})
+
+
+# ---------------------------------------------------------------------
+#   Loading file content of Новый журнал по заявкам <year>.xlsm file
 # ---------------------------------------------------------------------
+@timed_stage
 def load_new_jornal(filename):
     df = pd.DataFrame()
     try:
-        df = pd.read_excel(filename, sheet_name='Лист1', skiprows=6)
+        df = read_sheet(filename, 'Лист1', 6)
     except FileNotFoundError:
-        print("File Новый журнал по заявкам 2023.xlsm does not exist")
+        print("File " + filename + " does not exist")
     return df
 
 
 # ---------------------------------------------------------------------
-#   Loading file content of График планового мониторинга 2023.xlsx file
+#   Loading file content of График планового мониторинга <year>.xlsx file
 # ---------------------------------------------------------------------
+@timed_stage
 def load_mon(filename):
     df = pd.DataFrame()
     try:
-        df = pd.read_excel(filename, sheet_name='График', skiprows=0)
+        df = read_sheet(filename, 'График', 0)
     except FileNotFoundError:
-        print("График планового мониторинга 2023.xlsx")
+        print("File " + filename + " does not exist")
     return df
 
 
 # ---------------------------------------------------------------------
-#   # Find the leaders
+#   Source cache: keep parsed workbooks while the files are unchanged
 # ---------------------------------------------------------------------
-def top_leaders(df_mon_f, date_start, date_end):
-    df_top_f = pd.DataFrame()
+#   Set True to compare a SHA-1 of the file content when mtime or size differ
+#   (the file is read once more, but not parsed, if it was only re-saved)
+SOURCE_CACHE_USE_HASH = False
+
+#   filename -> (mtime, size, sha1 or None, DataFrame)
+source_cache = {}
+source_cache_stats = {'hits': 0, 'misses': 0, 'parse_time': 0.0, 'last_parse_time': {}}
+source_cache_lock = threading.Lock()
+
+
+def file_hash(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, mode='rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def load_cached(filename, loader, use_hash=SOURCE_CACHE_USE_HASH):
     try:
-        #   Changing type of some fields (from Object to Date)
-        df_mon_f['Дата заключения УМОД'] = df_mon_f['Дата заключения УМОД'].astype("datetime64[ns]")
+        stat = os.stat(filename)
+    except OSError:
+        #   Let the loader report the missing file, nothing to cache
+        return loader(filename)
+
+    with source_cache_lock:
+        cached = source_cache.get(filename)
+    content_hash = None
+    if cached is not None:
+        if cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            with source_cache_lock:
+                source_cache_stats['hits'] += 1
+            return cached[3]
+        if use_hash and cached[2] is not None:
+            #   Touched or re-saved file with the same content is still a hit
+            content_hash = file_hash(filename)
+            if content_hash == cached[2]:
+                with source_cache_lock:
+                    source_cache[filename] = (stat.st_mtime_ns, stat.st_size, content_hash, cached[3])
+                    source_cache_stats['hits'] += 1
+                return cached[3]
+
+    time_start = time.perf_counter()
+    df = parse_source(filename, loader)
+    parse_time = time.perf_counter() - time_start
+    if use_hash and content_hash is None:
+        content_hash = file_hash(filename)
+
+    with source_cache_lock:
+        source_cache[filename] = (stat.st_mtime_ns, stat.st_size, content_hash, df)
+        source_cache_stats['misses'] += 1
+        source_cache_stats['parse_time'] += parse_time
+        source_cache_stats['last_parse_time'][filename] = parse_time
+    print("File " + filename + " parsed in " + format(parse_time, '.2f') + " s")
+    return df
 
-        #   Reduction the range by date
-        df_top_f = df_mon_f[(df_mon_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
-                            (df_mon_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
 
+# ---------------------------------------------------------------------
+#   Workbooks are parsed in worker processes, all of them at the same time.
+#   A parsed sheet comes back as Arrow IPC stream (pickle, if pyarrow is not installed
+#   or the sheet has columns of mixed types)
+# ---------------------------------------------------------------------
+#   With one CPU the workbooks are parsed in this process (the threads still wait for the share together)
+SOURCE_PROCESSES = 2 if (os.cpu_count() or 1) > 1 else 0  # 0: parse in this process
+
+source_pool = None
+source_pool_lock = threading.Lock()
+
+
+def get_source_pool():
+    global source_pool
+
+    with source_pool_lock:
+        if source_pool is None and SOURCE_PROCESSES > 0:
+            #   Not forked: a fork of a process with running threads may inherit a held lock
+            source_pool = concurrent.futures.ProcessPoolExecutor(max_workers=SOURCE_PROCESSES,
+                                                                 mp_context=multiprocessing.get_context('spawn'))
+        return source_pool
+
+
+def parse_in_process(filename, loader_name):
+    #   Runs in a worker process, the time of the stage is counted by parse_source() in the main process
+    loader = globals()[loader_name]
+    df = getattr(loader, '__wrapped__', loader)(filename)
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return 'arrow', sink.getvalue()
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass
+    return 'pickle', df
+
+
+def frame_from_arrow(buffer):
+    df = pa.ipc.open_stream(buffer).read_all().to_pandas()
+
+    #   Empty text cells are NaN, as after read_excel()
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+@timed_stage
+def parse_source(filename, loader):
+    global source_pool
+
+    pool = get_source_pool()
+    if pool is None:
+        return loader(filename)
+    try:
+        kind, data = pool.submit(parse_in_process, filename, loader.__name__).result()
+    except concurrent.futures.process.BrokenProcessPool as e:
+        print(e)
+        print("Worker process is broken, file " + filename + " is parsed here")
+        with source_pool_lock:
+            source_pool = None
+        return loader(filename)
+    return frame_from_arrow(data) if kind == 'arrow' else data
+
+
+def load_sources(sources, use_cache=True):
+    #   (filename, loader) -> DataFrame. Every file waits for its worker in its own thread:
+    #   the time of loading is the time of the longest file, not the sum
+    load = load_cached if use_cache else parse_source
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        return list(executor.map(lambda source: load(*source), sources))
+
+
+def source_cache_report():
+    with source_cache_lock:
+        return "Source cache: hits={}, misses={}, parse time={:.2f} s".format(
+            source_cache_stats['hits'], source_cache_stats['misses'], source_cache_stats['parse_time'])
+
+
+# ---------------------------------------------------------------------
+#   # Find the leaders
+# ---------------------------------------------------------------------
+@timed_stage
+def top_leaders(counts_f):
+    df_top_f = pd.DataFrame()
+    try:
         #############################################################################################################
         #
         # Count for each employee (Choose field "Исполнитель" if you use "Новый журнал по заявкам 2023.xlsm" or
         #                               field "Ф.И.О. исполнителя" if you use "График планового мониторинга 2023.xlsx")
+        #   Counts come from count_in_period(df, ['Ф.И.О. исполнителя', 'Алматы'], ...) and view_counts()
         #
         #############################################################################################################
-        # df_top_f = df_top_f[["Исполнитель", "Дата заключения УМОД"]] \
-        #     .groupby(['Исполнитель']) \
-        #     .count().reset_index()
-        df_top_f = df_top_f[["Ф.И.О. исполнителя", "Дата заключения УМОД"]] \
-            .groupby(['Ф.И.О. исполнителя']) \
-            .count().reset_index()
-
-        # Rename column
-        df_top_f.rename(columns={'Дата заключения УМОД': 'Количество'}, inplace=True)
+        df_top_f = counts_f.rename('Количество').reset_index()
 
         # First 20 employees
         df_top_f = df_top_f.sort_values(by=["Количество", "Ф.И.О. исполнителя"],
-                                        ascending=[False, True]).groupby(['Ф.И.О. исполнителя'], as_index=False).nth[
+                                        ascending=[False, True]).groupby(['Ф.И.О. исполнителя'], as_index=False,
+                                                                    observed=True).nth[
                    :20]
     except Exception as e:
         print(e)
@@ -96,28 +360,17 @@ def top_leaders(df_mon_f, date_start, date_end):
 # ---------------------------------------------------------------------
 #   # Top of branches
 # ---------------------------------------------------------------------
-def top_branches(df_mon_f, date_start, date_end):
+@timed_stage
+def top_branches(counts_f):
     df_top_f = pd.DataFrame()
     try:
-        #   Changing type of some fields (from Object to Date)
-        df_mon_f['Дата заключения УМОД'] = df_mon_f['Дата заключения УМОД'].astype("datetime64[ns]")
-
-        #   Reduction the range of date
-        df_top_f = df_mon_f[(df_mon_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
-                            (df_mon_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
-
-        # Count for each branch
-        df_top_f = df_top_f[["Филиал Банка (рассмотрения заявки)", "Дата заключения УМОД"]] \
-            .groupby(['Филиал Банка (рассмотрения заявки)']) \
-            .count().reset_index()
-
-        # Rename column
-        df_top_f.rename(columns={'Дата заключения УМОД': 'Количество'}, inplace=True)
+        #   Counts for each branch come from count_in_period() and view_counts()
+        df_top_f = counts_f.rename('Количество').reset_index()
 
         # First branches
         df_top_f = df_top_f.sort_values(by=["Филиал Банка (рассмотрения заявки)", "Количество"],
                                         ascending=[True, False]).groupby(['Филиал Банка (рассмотрения заявки)'],
-                                                                         as_index=False).nth[:10]
+                                                                         as_index=False, observed=True).nth[:10]
     except Exception as e:
         print(e)
         print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
@@ -125,22 +378,38 @@ def top_branches(df_mon_f, date_start, date_end):
     return df_top_f
 
 
+# ---------------------------------------------------------------------
+#   Count cases closed (Дата заключения УМОД) in the period by keys
+# ---------------------------------------------------------------------
+@timed_stage
+def count_in_period(df_mon_f, keys, date_start, date_end):
+    counts_f = pd.Series(dtype='int64')
+    try:
+        #   Reduction the range by date
+        df_top_f = df_mon_f[(df_mon_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
+                            (df_mon_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
+
+        counts_f = df_top_f.groupby(keys, observed=True)['Дата заключения УМОД'].count()
+    except Exception as e:
+        print(e)
+        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
+              "либо в файле Новый журнал по заявкам 2023.xlsm")
+    return counts_f
+
+
 # ---------------------------------------------------------------------
 #   # Find the anti-leaders from each branch
 # ---------------------------------------------------------------------
 def antitop_filials_r(df_mon_f, date_start, date_end):
     df_antitop_f = pd.DataFrame()
     try:
-        #   Changing type of some fields (from Object to Date)
-        df_mon_f['Дата заключения УМОД'] = df_mon_f['Дата заключения УМОД'].astype("datetime64[ns]")
-
         #   Reduction the range of date
         df_antitop_f = df_mon_f[(df_mon_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
                                 (df_mon_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
 
         # Count for each employee
         df_antitop_f = df_antitop_f[["Филиал Банка (рассмотрения заявки)", "Исполнитель", "Дата заключения УМОД"]] \
-            .groupby(['Филиал Банка (рассмотрения заявки)', 'Исполнитель']) \
+            .groupby(['Филиал Банка (рассмотрения заявки)', 'Исполнитель'], observed=True) \
             .count().reset_index()
 
         # Rename column
@@ -150,7 +419,7 @@ def antitop_filials_r(df_mon_f, date_start, date_end):
         df_antitop_f = df_antitop_f.sort_values(by=["Количество", "Филиал Банка (рассмотрения заявки)", "Исполнитель"],
                                                 ascending=[True, True, True]).groupby(
             ['Филиал Банка (рассмотрения заявки)'],
-            as_index=False).nth[:1]
+            as_index=False, observed=True).nth[:1]
     except Exception as e:
         print(e)
         print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
@@ -159,295 +428,122 @@ def antitop_filials_r(df_mon_f, date_start, date_end):
 
 
 # ---------------------------------------------------------------------
-#   Calculate average time of monitoring
+#   Durations: text "ЧЧ:ММ:СС" of the workbook <-> timedelta
 # ---------------------------------------------------------------------
-def average_filials_r(df_temp_f, date_start, date_end):
-    df_top_f = pd.DataFrame()
-    try:
-        #   Clean dataframe
-        df_temp_f.dropna()
+def parse_duration(series):
+    return pd.to_timedelta(series.astype(str), errors='coerce')
 
-        #   Changing type of some fields (from Object to Date)
-        df_temp_f['Дата заключения УМОД'] = df_temp_f['Дата заключения УМОД'].astype("datetime64[ns]")
 
-        #   Reduction the range of date
-        df_top_f = df_temp_f[(df_temp_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
-                             (df_temp_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
-        df_top_f = df_top_f[["Филиал исполнитель ДМОД", "Время затраченное на заключение Исполнителем"]]
-
-        # Formatting to datetime
-        df_top_f['Время затраченное на заключение Исполнителем'] = pd.to_datetime(
-            df_top_f['Время затраченное на заключение Исполнителем'], format='%H:%M:%S')
-
-        # Calc average time
-        df_top_f = df_top_f.groupby('Филиал исполнитель ДМОД').mean().reset_index()
-
-        # Formatting to string
-        df_top_f['Время затраченное на заключение Исполнителем'] = df_top_f[
-            'Время затраченное на заключение Исполнителем'].dt.strftime('%H:%M:%S')
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return df_top_f
+def format_duration(series):
+    #   Whole seconds, as in the workbook
+    return (pd.Timestamp('1900-01-01') + series.dt.floor('s')).dt.strftime('%H:%M:%S')
 
 
 # ---------------------------------------------------------------------
-#   Calculating average time of monitoring, according categories
+#   Average time of monitoring (Исполнитель) and of approving (куратор),
+#   by branches and by categories and branches: one grouped pass for the four tables
 # ---------------------------------------------------------------------
-def average_filials_unique(df_temp_f, date_start, date_end):
-    df_top_f = pd.DataFrame()
+@timed_stage
+def average_times(df_temp_f, date_start, date_end):
+    df_filials_r = df_filials_unique = df_f_apr_r = df_f_apr_unique = pd.DataFrame()
     try:
-        #   Clean
-        df_temp_f.dropna()
-
-        #   Changing type of some fields (from Object to Date)
-        df_temp_f['Дата заключения УМОД'] = df_temp_f['Дата заключения УМОД'].astype("datetime64[ns]")
-
         #   Reduction the range of date
         df_top_f = df_temp_f[(df_temp_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
                              (df_temp_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
-        df_top_f = df_top_f[["Уникальность обеспечения", "Филиал исполнитель ДМОД",
-                             "Время затраченное на заключение Исполнителем"]]
-
-        # Formatting to datetime
-        df_top_f['Время затраченное на заключение Исполнителем'] = pd.to_datetime(
-            df_top_f['Время затраченное на заключение Исполнителем'], format='%H:%M:%S')
-
-        # Calculate average time
-        df_top_f = df_top_f.groupby(['Уникальность обеспечения', 'Филиал исполнитель ДМОД']) \
-            .agg({'Время затраченное на заключение Исполнителем': ['mean']}).reset_index()
 
-        # Formatting to string
-        df_top_f.columns = df_top_f.columns.map('_'.join)
-        df_top_f['Время затраченное на заключение Исполнителем_mean'] = df_top_f[
-            'Время затраченное на заключение Исполнителем_mean'].dt.strftime('%H:%M:%S')
+        #   Sum (in nanoseconds) and number of durations by categories and branches
+        parts = {}
+        for column in DURATION_COLUMNS:
+            parts[column + '_sum'] = df_top_f[column].fillna(pd.Timedelta(0)).astype('int64')
+            parts[column + '_count'] = df_top_f[column].notna()
+        df_grouped = pd.DataFrame(parts).groupby(
+            [df_top_f['Уникальность обеспечения'], df_top_f['Филиал исполнитель ДМОД']],
+            observed=True, dropna=False).sum()
+
+        #   Average of the groups, whole seconds (NaT if there is no duration at all)
+        def mean_time(df_sum, column):
+            counts = df_sum[column + '_count']
+            mean = pd.Series(pd.NaT, index=df_sum.index, dtype='timedelta64[ns]')
+            mean[counts > 0] = pd.to_timedelta(df_sum.loc[counts > 0, column + '_sum'] // counts[counts > 0],
+                                               unit='ns').dt.floor('s')
+            return mean
+
+        #   By branches: categories are summed up
+        df_sum_r = df_grouped.groupby(level='Филиал исполнитель ДМОД', observed=True).sum()
+
+        #   By categories and branches: the empty ones are skipped
+        df_sum_unique = df_grouped[df_grouped.index.get_level_values(0).notna()
+                                   & df_grouped.index.get_level_values(1).notna()]
+
+        monitoring, approving = DURATION_COLUMNS
+        df_filials_r = mean_time(df_sum_r, monitoring).rename(monitoring).reset_index()
+        df_f_apr_r = mean_time(df_sum_r, approving).reset_index()
+        df_f_apr_r.columns = ['Филиал исполнитель ДМОД_', approving + '_mean']
+        df_filials_unique = mean_time(df_sum_unique, monitoring).reset_index()
+        df_filials_unique.columns = ['Уникальность обеспечения_', 'Филиал исполнитель ДМОД_', monitoring + '_mean']
+        df_f_apr_unique = mean_time(df_sum_unique, approving).reset_index()
+        df_f_apr_unique.columns = ['Уникальность обеспечения_', 'Филиал исполнитель ДМОД_', approving + '_mean']
     except Exception as e:
         print(e)
         print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
               "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return df_top_f
+    return df_filials_r, df_filials_unique, df_f_apr_r, df_f_apr_unique
 
 
 # ---------------------------------------------------------------------
-#   Average time of approving
+#   Average times as text "ЧЧ:ММ:СС" for the tables
 # ---------------------------------------------------------------------
-def average_f_apr_r(df_temp_f, date_start, date_end):
-    df_top_f = pd.DataFrame()
-    try:
-        #   Clean
-        df_temp_f.dropna()
-
-        #   Changing type of some fields (from Object to Date)
-        df_temp_f['Дата заключения УМОД'] = df_temp_f['Дата заключения УМОД'].astype("datetime64[ns]")
-
-        #   Reduction the range of date
-        df_top_f = df_temp_f[(df_temp_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
-                             (df_temp_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
-        df_top_f = df_top_f[["Уникальность обеспечения", "Филиал исполнитель ДМОД",
-                             "Время затраченное на согласование куратором"]]
-
-        #   Formatting to datetime
-        df_top_f['Время затраченное на согласование куратором'] = pd.to_datetime(
-            df_top_f['Время затраченное на согласование куратором'], format='%H:%M:%S')
-
-        #   Average time
-        df_top_f = df_top_f.groupby('Филиал исполнитель ДМОД') \
-            .agg({'Время затраченное на согласование куратором': ['mean']}).reset_index()
-
-        #   Formatting to string
-        df_top_f.columns = df_top_f.columns.map('_'.join)
-        df_top_f['Время затраченное на согласование куратором_mean'] = df_top_f[
-            'Время затраченное на согласование куратором_mean'].dt.strftime('%H:%M:%S')
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return df_top_f
+def format_average(df_temp):
+    return df_temp.assign(**{column: format_duration(df_temp[column]) for column in df_temp.columns
+                             if column.startswith('Время затраченное')})
 
 
 # ---------------------------------------------------------------------
-#   Average time of approving, according categories
+#   Months: names of the workbook -> numbers 1..12 (0 for empty cells and unknown names)
 # ---------------------------------------------------------------------
-def average_f_apr_unique(df_temp_f, date_start, date_end):
-    df_top_f = pd.DataFrame()
-    try:
-        #   Clean NaN
-        df_temp_f.dropna()
-
-        #   Changing type of some fields (from Object to Date)
-        df_temp_f['Дата заключения УМОД'] = df_temp_f['Дата заключения УМОД'].astype("datetime64[ns]")
-
-        #   Reduction the range of date
-        df_top_f = df_temp_f[(df_temp_f['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
-                             (df_temp_f['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
-        df_top_f = df_top_f[["Уникальность обеспечения", "Филиал исполнитель ДМОД",
-                             "Время затраченное на согласование куратором"]]
-
-        #   Formatting to datetime
-        df_top_f['Время затраченное на согласование куратором'] = pd.to_datetime(
-            df_top_f['Время затраченное на согласование куратором'], format='%H:%M:%S')
+MONTHS = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь',
+          'декабрь']
+MONTH_NUMBERS = {name: number for number, name in enumerate(MONTHS, start=1)}
 
-        #   Average time
-        df_top_f = df_top_f.groupby(['Уникальность обеспечения', 'Филиал исполнитель ДМОД']) \
-            .agg({'Время затраченное на согласование куратором': ['mean']}).reset_index()
 
-        #   Formatting to string
-        df_top_f.columns = df_top_f.columns.map('_'.join)
-        df_top_f['Время затраченное на согласование куратором_mean'] = df_top_f[
-            'Время затраченное на согласование куратором_mean'].dt.strftime('%H:%M:%S')
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return df_top_f
+def month_number(series):
+    return series.astype(str).str.lower().map(MONTH_NUMBERS).fillna(0).astype('int8')
 
 
-# ---------------------------------------------------------------------
-#   Return number of planned cases
-# ---------------------------------------------------------------------
-def calc_plan(df_temp, date_temp):
-    #   Init
-    number_of_plan = pd.DataFrame()
-    try:
-        #   Calculate month
-        datetime_object = datetime.strptime(date_temp, '%d.%m.%Y')
-        date_month = datetime_object.month
-
-        #   Init variable
-        date_month_str = ''
-        match date_month:
-            case 1:
-                date_month_str = ['январь']
-            case 2:
-                date_month_str = ['январь', 'февраль']
-            case 3:
-                date_month_str = ['январь', 'февраль', 'март']
-            case 4:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель']
-            case 5:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май']
-            case 6:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь']
-            case 7:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль']
-            case 8:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август']
-            case 9:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь']
-            case 10:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь']
-            case 11:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь']
-            case 12:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь', 'декабрь']
-
-        #   Reduce number of columns
-        df_temp = df_temp[
-            ['Филиал исполнитель ДМОД', 'График (месяц)', 'График скорректированный (месяц)', 'Статус залога 01.2023']]
-
-        #   Calculate number of planning cases
-        df_temp = df_temp[((df_temp['График скорректированный (месяц)'].str.lower().isin(date_month_str))
-                           | ((pd.isnull(df_temp['График скорректированный (месяц)']))
-                              & (df_temp['График (месяц)'].str.lower().isin(date_month_str))))
-                          & (df_temp['Статус залога 01.2023'] == 'Принят к учету')]
-        number_of_plan = df_temp.groupby('Филиал исполнитель ДМОД').count().reset_index()
-        number_of_plan = number_of_plan[['Филиал исполнитель ДМОД', 'График (месяц)']]
-
-        #   Rename result column
-        number_of_plan.rename(columns={'График (месяц)': 'План'}, inplace=True)
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return number_of_plan
+def months_up_to(numbers, month_temp):
+    return numbers.between(1, month_temp)
 
 
 # ---------------------------------------------------------------------
-# Return year monitoring plan
+# Month of the plan: the corrected one, if it is set
 # ---------------------------------------------------------------------
-def calc_plan_year(df_temp):
-    df_plan_year_temp = pd.DataFrame()
-    try:
-        #   Reduce number of columns
-        df_temp = df_temp[
-            ['Филиал исполнитель ДМОД', 'График (месяц)', 'График скорректированный (месяц)', 'Статус залога 01.2023']]
-
-        #   Aggregate data in new column Месяц
-        df_temp['Месяц'] = np.where(pd.notna(df_temp['График скорректированный (месяц)']),
-                                    df_temp['График скорректированный (месяц)'], df_temp['График (месяц)'])
-
-        #   Calculate total number of monitoring cases
-        df_plan_year_temp = df_temp.groupby('Месяц').count().reset_index()
-
-        #   Prepare some Set to arrange names of months
-        monthgrades = {'январь': 1, 'февраль': 2, 'март': 3, 'апрель': 4, 'май': 5, 'июнь': 6, 'июль': 7,
-                       'август': 8, 'сентябрь': 9, 'октябрь': 10, 'ноябрь': 11, 'декабрь': 12}
-
-        #   Function to sort by month
-        def month_sort(series):
-            return series.apply(lambda x: monthgrades.get(x))
-
-        #   Sorting
-        df_plan_year_temp = df_plan_year_temp.sort_values(by=["Месяц"], key=month_sort)
-
-        #   Reduce number of columns
-        df_plan_year_temp = df_plan_year_temp[['Месяц', 'График (месяц)']]
-
-        #   Rename some columns
-        df_plan_year_temp.rename(columns={'График (месяц)': 'Количество'}, inplace=True)
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return df_plan_year_temp
+def plan_month(df_temp):
+    return pd.Series(np.where(pd.notna(df_temp['График скорректированный (месяц)']),
+                              df_temp['График скорректированный (месяц)'], df_temp['График (месяц)']),
+                     index=df_temp.index, name='Месяц')
 
 
 # ---------------------------------------------------------------------
-# Return completed monitoring cases
+# Make year table (Месяц, Количество) from counts by month
 # ---------------------------------------------------------------------
-def calc_compl_year(df_temp):
-    df_copl_year_temp = pd.DataFrame()
+def year_table(counts_temp):
+    df_year_temp = pd.DataFrame()
     try:
-        #   Reduce number of columns
-        df_temp = df_temp[
-            ['Филиал исполнитель ДМОД', 'График (месяц)', 'График скорректированный (месяц)', 'Статус залога 01.2023']]
-
-        #   Aggregate data in new column Месяц
-        df_temp['Месяц'] = np.where(pd.notna(df_temp['График скорректированный (месяц)']),
-                                    df_temp['График скорректированный (месяц)'], df_temp['График (месяц)'])
-
-        #   Calculate total number of monitoring cases
-        df_copl_year_temp = df_temp.groupby('Месяц').count().reset_index()
-
-        #   Prepare some Set to arrange names of months
-        monthgrades = {'январь': 1, 'февраль': 2, 'март': 3, 'апрель': 4, 'май': 5, 'июнь': 6, 'июль': 7,
-                       'август': 8, 'сентябрь': 9, 'октябрь': 10, 'ноябрь': 11, 'декабрь': 12}
+        df_year_temp = counts_temp.rename('Количество').reset_index()
 
-        #   Sort by month
-        def month_sort(series):
-            return series.apply(lambda x: monthgrades.get(x))
-
-        df_copl_year_temp = df_copl_year_temp.sort_values(by=["Месяц"], key=month_sort)
-
-        #   Reduce number of columns
-        df_copl_year_temp = df_copl_year_temp[['Месяц', 'График (месяц)']]
-
-        #   Rename result column
-        df_copl_year_temp.rename(columns={'График (месяц)': 'Количество'}, inplace=True)
+        #   Sorting by number of month
+        df_year_temp = df_year_temp.sort_values(by=["Месяц"], key=lambda series: series.map(MONTH_NUMBERS))
     except Exception as e:
         print(e)
         print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
               "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return df_copl_year_temp
+    return df_year_temp
 
 
 # ---------------------------------------------------------------------
 # Return number of expired
 # ---------------------------------------------------------------------
+@timed_stage
 def calc_expired(df_plan_temp, df_calc_temp, month_temp):
     number_exp = 0
     try:
@@ -461,37 +557,8 @@ def calc_expired(df_plan_temp, df_calc_temp, month_temp):
         #   Subtraction two columns to calculate expired cases
         df_expired['Просрочено'] = df_expired['Количество_x'] - df_expired['Количество_y']
 
-        date_month_str = []
-        match month_temp:
-            case '01':
-                date_month_str = []
-            case '02':
-                date_month_str = ['январь']
-            case '03':
-                date_month_str = ['январь', 'февраль']
-            case '04':
-                date_month_str = ['январь', 'февраль', 'март']
-            case '05':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель']
-            case '06':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май']
-            case '07':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь']
-            case '08':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль']
-            case '09':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август']
-            case '10':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь']
-            case '11':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь']
-            case '12':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь']
-
-        #   Filter
-        df_expired = df_expired[df_expired['Месяц'].str.lower().isin(date_month_str)]
+        #   Filter: months before the current one
+        df_expired = df_expired[months_up_to(month_number(df_expired['Месяц']), int(month_temp) - 1)]
 
         #   Sum expired
         number_exp = df_expired['Просрочено'].sum()
@@ -507,42 +574,15 @@ def calc_expired(df_plan_temp, df_calc_temp, month_temp):
 # ---------------------------------------------------------------------
 # Return list of expired cases
 # ---------------------------------------------------------------------
+@timed_stage
 def calc_list_expired(df_plan_temp, month_temp):
     #   Reduce number of columns
     list_expired = df_plan_temp[['Код объекта залога', 'Класс обеспечения', 'Наименование заемщика Сцепка',
                                  'Филиал исполнитель ДМОД', 'График скорректированный (месяц)', 'Статус ДМОД']]
-    date_month_str = []
     try:
-        match month_temp:
-            case '01':
-                date_month_str = []
-            case '02':
-                date_month_str = ['январь']
-            case '03':
-                date_month_str = ['январь', 'февраль']
-            case '04':
-                date_month_str = ['январь', 'февраль', 'март']
-            case '05':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель']
-            case '06':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май']
-            case '07':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь']
-            case '08':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль']
-            case '09':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август']
-            case '10':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь']
-            case '11':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь']
-            case '12':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь']
-
-        #   Filter
-        list_expired = list_expired[list_expired['График скорректированный (месяц)'].str.lower().isin(date_month_str)]
+        #   Filter: corrected months before the current one
+        list_expired = list_expired[months_up_to(df_plan_temp['Номер месяца (скорректированный)'],
+                                                 int(month_temp) - 1)]
 
         #   Final result list
         list_expired = list_expired[pd.isnull(list_expired['Статус ДМОД'])]
@@ -553,152 +593,25 @@ def calc_list_expired(df_plan_temp, month_temp):
     return list_expired
 
 
-# ---------------------------------------------------------------------
-# Return top expired cases
-# ---------------------------------------------------------------------
-def calc_top_expired(df_plan_temp, month_temp):
-    #   Reduce number of columns
-    top_expired = df_plan_temp[['Филиал исполнитель ДМОД', 'График скорректированный (месяц)', 'Статус ДМОД']]
-
-    date_month_str = []
-    try:
-        match month_temp:
-            case '01':
-                date_month_str = []
-            case '02':
-                date_month_str = ['январь']
-            case '03':
-                date_month_str = ['январь', 'февраль']
-            case '04':
-                date_month_str = ['январь', 'февраль', 'март']
-            case '05':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель']
-            case '06':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май']
-            case '07':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь']
-            case '08':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль']
-            case '09':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август']
-            case '10':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь']
-            case '11':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь']
-            case '12':
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь']
-
-        #   Filter
-        top_expired = top_expired[top_expired['График скорректированный (месяц)'].str.lower().isin(date_month_str)]
-
-        #   Pick only not completed cases
-        top_expired = top_expired[pd.isnull(top_expired['Статус ДМОД'])]
-
-        #   Count number of expired cases
-        top_expired = top_expired.groupby('Филиал исполнитель ДМОД').count().reset_index()
-
-        #   Reduce number of columns
-        top_expired = top_expired[['Филиал исполнитель ДМОД', 'График скорректированный (месяц)']]
-
-        #   Rename column
-        top_expired.rename(columns={'График скорректированный (месяц)': 'Просрочено'}, inplace=True)
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return top_expired
-
-
-# ---------------------------------------------------------------------
-# Return number of completed cases
-# ---------------------------------------------------------------------
-def calc_completed(df_temp, date_temp):
-    number_compl = pd.DataFrame()
-    try:
-        #   Create datetime object from string
-        datetime_object = datetime.strptime(date_temp, '%d.%m.%Y')
-
-        #   Choose only month
-        date_month = datetime_object.month
-
-        date_month_str = []
-        match date_month:
-            case 1:
-                date_month_str = ['январь']
-            case 2:
-                date_month_str = ['январь', 'февраль']
-            case 3:
-                date_month_str = ['январь', 'февраль', 'март']
-            case 4:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель']
-            case 5:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май']
-            case 6:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь']
-            case 7:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль']
-            case 8:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август']
-            case 9:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь']
-            case 10:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь']
-            case 11:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь']
-            case 12:
-                date_month_str = ['январь', 'февраль', 'март', 'апрель', 'май', 'июнь', 'июль', 'август', 'сентябрь',
-                                  'октябрь', 'ноябрь', 'декабрь']
-
-        #   Reduce number of columns
-        df_temp = df_temp[
-            ['Филиал исполнитель ДМОД', 'График (месяц)', 'График скорректированный (месяц)', 'Статус ДМОД',
-             'Статус залога 01.2023']]
-
-        #   Choose only completed cases
-        df_temp = df_temp[((df_temp['График скорректированный (месяц)'].str.lower().isin(date_month_str))
-                           | ((pd.isnull(df_temp['График скорректированный (месяц)']))
-                              & (df_temp['График (месяц)'].str.lower().isin(date_month_str))))]
-
-        #   Count completed cases by branches
-        number_compl = df_temp.groupby('Филиал исполнитель ДМОД').count().reset_index()
-
-        #   Reduce number of columns
-        number_compl = number_compl[['Филиал исполнитель ДМОД', 'График (месяц)']]
-
-        #   Rename result column
-        number_compl.rename(columns={'График (месяц)': 'Выполнено'}, inplace=True)
-    except Exception as e:
-        print(e)
-        print("Неправильный формат в ячейке в файле График планового мониторинга 2023.xlsx, "
-              "либо в файле Новый журнал по заявкам 2023.xlsm")
-    return number_compl
-
-
 # ---------------------------------------------------------------------
 #    Process file "Новый журнал по заявкам.xlsm" to make list of implementers and approvers
 # ---------------------------------------------------------------------
 def journal_request(df1, date_start, date_end):
     df_merge_ei = pd.DataFrame()
     try:
-        #   Changing type of some fields (from Object to Date)
-        df1['Дата заключения УМОД'] = df1['Дата заключения УМОД'].astype("datetime64[ns]")
-
         #   Reduction the range of date
         df1 = df1[(df1['Дата заключения УМОД'] >= date_start + ' 00:00:00') &
                   (df1['Дата заключения УМОД'] <= date_end + ' 23:59:59')]
 
         #   Calculate number of implementers
-        df_impl1 = df1[["Исполнитель", "Дата заключения УМОД"]].groupby(['Исполнитель']).count()
+        df_impl1 = df1[["Исполнитель", "Дата заключения УМОД"]].groupby(['Исполнитель'], observed=True).count()
 
         #   Rename some columns
         df_impl1.rename(columns={'Дата заключения УМОД': 'Исполнитель'}, inplace=True)
 
         #   Calculate number of approvers
-        df_approver1 = df1[["Согласующий Куратор", "Дата заключения УМОД"]].groupby('Согласующий Куратор').count()
+        df_approver1 = df1[["Согласующий Куратор", "Дата заключения УМОД"]].groupby('Согласующий Куратор',
+                                                                                     observed=True).count()
 
         #   Rename some columns
         df_approver1.rename(columns={'Дата заключения УМОД': 'Согласующий'}, inplace=True)
@@ -714,18 +627,105 @@ def journal_request(df1, date_start, date_end):
 
 
 # ---------------------------------------------------------------------
-#    Writing temp table in to CSV file "Мониторинг 2023.csv"
+#    Writing temp table in to CSV file "Мониторинг <year>.csv"
 # ---------------------------------------------------------------------
+#   You can change directory and name of file, {year} is replaced by the report year
+CSV_EXPORT_FILE = '\\\BCCFS-HQ\\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Мониторинг {year}.csv'
+# CSV_EXPORT_FILE = 'Мониторинг {year}.csv'
+
+
+@timed_stage
 def write_to_csv(df_work):
+    filename = CSV_EXPORT_FILE.format(year=REPORT_YEAR)
     try:
-        #   Writing DataFrames into csv file (you can change directory and name of file)
-        df_work.to_csv('\\\BCCFS-HQ\\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Мониторинг 2023.csv',
-                       sep=';', encoding='utf-16', index_label='Ф.И.О.')
-        # df_work.to_csv('Мониторинг 2023.csv', sep=';', encoding='utf-16', index_label='Ф.И.О.')
-        print("File 'Мониторинг 2023.csv' successfully created")
+        #   Durations are written as in the workbook, the status column has the name of the workbook
+        df_work = df_work.drop(columns=CALCULATED_COLUMNS)
+        df_work = df_work.assign(**{column: format_duration(df_work[column]) for column in DURATION_COLUMNS})
+        df_work = df_work.rename(columns={STATUS_COLUMN: STATUS_COLUMN_PREFIX + str(REPORT_YEAR)})
+
+        #   Writing DataFrames into a temp file, then replace the old file at once:
+        #   the file on the share is never half-written
+        df_work.to_csv(filename + '.tmp', sep=';', encoding='utf-16', index_label='Ф.И.О.')
+        os.replace(filename + '.tmp', filename)
+        print("File '" + filename + "' successfully created")
+        return True
     except Exception as e:
         print(e)
-        print("Can not write to a file 'Мониторинг 2023.csv'")
+        print("Can not write to a file '" + filename + "'")
+        return False
+
+
+# ---------------------------------------------------------------------
+#    Export of "Мониторинг <year>.csv" in background, only if the data were changed
+# ---------------------------------------------------------------------
+csv_export_queue = queue.Queue()
+csv_export_fingerprint = None
+csv_export_stats = {'written': 0, 'skipped': 0, 'failed': 0, 'export_time': 0.0, 'last_export_time': 0.0}
+csv_export_lock = threading.Lock()
+csv_exporter = None
+
+
+def data_fingerprint(df_work):
+    sha1 = hashlib.sha1()
+    sha1.update(str(list(df_work.columns)).encode())
+    sha1.update(pd.util.hash_pandas_object(df_work, index=True).values.tobytes())
+    return sha1.hexdigest()
+
+
+def csv_export_loop():
+    global csv_export_fingerprint
+
+    while True:
+        df_work = csv_export_queue.get()
+
+        #   Only the newest data are worth writing
+        try:
+            while True:
+                df_work = csv_export_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            fingerprint = data_fingerprint(df_work)
+        except Exception as e:
+            print(e)
+            fingerprint = None
+        if fingerprint is not None and fingerprint == csv_export_fingerprint:
+            with csv_export_lock:
+                csv_export_stats['skipped'] += 1
+            print(csv_export_report())
+            continue
+
+        time_start = time.perf_counter()
+        written = write_to_csv(df_work)
+        export_time = time.perf_counter() - time_start
+        with csv_export_lock:
+            if written:
+                #   A failed write is tried again with the next data
+                csv_export_fingerprint = fingerprint
+                csv_export_stats['written'] += 1
+                csv_export_stats['export_time'] += export_time
+                csv_export_stats['last_export_time'] = export_time
+            else:
+                csv_export_stats['failed'] += 1
+        print(csv_export_report())
+
+
+def export_csv(df_work):
+    global csv_exporter
+
+    with csv_export_lock:
+        if csv_exporter is None:
+            csv_exporter = threading.Thread(target=csv_export_loop, name='csv-exporter', daemon=True)
+            csv_exporter.start()
+    csv_export_queue.put(df_work)
+
+
+def csv_export_report():
+    with csv_export_lock:
+        return "CSV export: written={}, skipped unchanged={}, failed={}, last export time={:.2f} s".format(
+            csv_export_stats['written'], csv_export_stats['skipped'], csv_export_stats['failed'],
+            csv_export_stats['last_export_time'])
 
 
 # ---------------------------------------------------------------------
@@ -759,798 +759,1993 @@ def read_from_note():
     return content
 
 
+# ---------------------------------------------------------------------
+#    Debounced saving of "notes.txt": write once the typing has stopped
+# ---------------------------------------------------------------------
+NOTE_SAVE_DELAY = 2.0  # seconds
+note_timer = None
+note_last_saved = None
+note_lock = threading.Lock()
+
+
+def flush_note(text):
+    global note_last_saved
+    with note_lock:
+        #   Skip the write if nothing was changed since the last one
+        if text == note_last_saved:
+            return
+        write_to_note(text)
+        note_last_saved = text
+
+
+def schedule_note_save(text):
+    global note_timer
+    with note_lock:
+        #   Every new keystroke postpones the write
+        if note_timer is not None:
+            note_timer.cancel()
+        note_timer = threading.Timer(NOTE_SAVE_DELAY, flush_note, args=(text,))
+        note_timer.start()
+
+
 # -------------------------------------------------------------------------
-#   Calculate, query ...
+#   Source files
 # -------------------------------------------------------------------------
-def make_calc(filter_temp, filter_branch):
-    global number_plan, top_plan_branch, number_completed, top_completed_branch, top_remained_branch, \
-        number_expired, top_expired_branch, list_expired_branch, df_top_filials, \
-        number_masssegment_completed, number_unique_completed, number_interval_completed, \
-        df_top_leaders, df_top_branches, plan_on_date, df_average_filials_r, df_average_filials_unique, \
-        df_plan_year, df_compl_year, df_plan_completed, df_plan_year_branch, df_compl_year_branch, \
-        df_average_f_apr_r, df_average_f_apr_unique, completed_on_date, df_list_branch, date_string_today
+#   Year of the report: the dashboard shows this year, the earlier years are kept in the history
+REPORT_YEAR = date.today().year
+#   The first year of the history
+FIRST_YEAR = 2023
 
-    # -------------------------------------------------------------------------
-    #   Load files
-    # -------------------------------------------------------------------------
-    # filename1 = "\\\BCCFS-HQ\\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Новый журнал по заявкам 2023.xlsm"
-    filename1 = "\\\\10.15.129.60\\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Новый журнал по заявкам 2023.xlsm"
-    # filename1 = "/mnt/share1/Новый журнал по заявкам 2023.xlsm"
-    # filename1 = "Новый журнал по заявкам 2023.xlsm"
-    df_new_jornal = load_new_jornal(filename1)
-
-    # filename3 = "\\\BCCFS-HQ\\reserve_data\отчеты УКР ДКР\Филиалы\\1. Мониторинг\\4. Мониторинг 2023\График планового мониторинга 2023.xlsx"
-    filename3 = "\\\\10.15.129.60\\reserve_data\отчеты УКР ДКР\Филиалы\\1. Мониторинг\\4. Мониторинг 2023\График планового мониторинга 2023.xlsx"
-    # filename3 = "/mnt/share2/График планового мониторинга 2023.xlsx"
-    # filename3 = "График планового мониторинга 2023.xlsx"
-    df_mon = load_mon(filename3)
-
-    #   Initializing range
-    date_rep = date.today()
-    year_rep = date_rep.strftime("%Y")
-    date_string_start = "01.01." + year_rep
-    date_string_end = "31.12." + year_rep
-    date_string_today = 'Экран выполнения мониторинга объектов залога в ' + year_rep + ' г. на : ' \
-                        + date_rep.strftime('%d.%m.%Y')
+#   {year} is replaced by the year of the files
+# SOURCE_JORNAL_TEMPLATE = "\\\BCCFS-HQ\\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Новый журнал по заявкам {year}.xlsm"
+SOURCE_JORNAL_TEMPLATE = "\\\\10.15.129.60\\reserve_data\отчеты УКР ДКР\ГО\Заявки на согласование ОМОД\Новый журнал по заявкам {year}.xlsm"
+# SOURCE_JORNAL_TEMPLATE = "/mnt/share1/Новый журнал по заявкам {year}.xlsm"
+# SOURCE_JORNAL_TEMPLATE = "Новый журнал по заявкам {year}.xlsm"
 
-    # ---------------------------------------------------------------------
-    #   Make main dataframe
-    # ---------------------------------------------------------------------
-    #   Merge two dataframes by column="Код объекта залога"
-    df_main_jornal = pd.merge(df_mon, df_new_jornal, how='left', left_on='Код объекта залога', right_on=' ID залога')
+# SOURCE_MON_TEMPLATE = "\\\BCCFS-HQ\\reserve_data\отчеты УКР ДКР\Филиалы\\1. Мониторинг\\4. Мониторинг {year}\График планового мониторинга {year}.xlsx"
+SOURCE_MON_TEMPLATE = "\\\\10.15.129.60\\reserve_data\отчеты УКР ДКР\Филиалы\\1. Мониторинг\\4. Мониторинг {year}\График планового мониторинга {year}.xlsx"
+# SOURCE_MON_TEMPLATE = "/mnt/share2/График планового мониторинга {year}.xlsx"
+# SOURCE_MON_TEMPLATE = "График планового мониторинга {year}.xlsx"
 
-    #   Pick columns
-    df_main_jornal = df_main_jornal[['Код объекта залога', 'Наименование заемщика Сцепка',
-                                     'Класс обеспечения', 'Наименование вида обеспечения', 'Месторасположение (Адрес)',
-                                     'Стоимость НОК либо Банка', 'Филиал исполнитель ДМОД', 'Статус залога 01.2023',
-                                     'График (месяц)', 'График скорректированный (месяц)', 'Статус ДМОД',
-                                     'Ф.И.О. исполнителя', 'Ф.И.О. согласующего',
-                                     'Дата заключения ДМОД ', 'Дата заключения УМОД',
-                                     'Цель составления заключения', 'Филиал Банка (рассмотрения заявки)',
-                                     'Исполнитель', 'Согласующий Куратор', 'Согласующий Начальник отдела',
-                                     'Согласующий Начальник Управления', 'Уникальность обеспечения',
-                                     'Время затраченное на заключение Исполнителем',
-                                     'Время затраченное на согласование куратором',
-                                     'В срок/просрочка по нормативному времени исполнителя',
-                                     'В срок/просрочка по нормативному времени согласующего куратора']]
-
-    df_main_jornal = df_main_jornal[(df_main_jornal['Статус залога 01.2023'].str.contains('Принят'))]
-
-    #   Calc main plan in to date
-    main_plan_on_date = calc_plan(df_main_jornal, date_string_end)
-
-    number_plan = main_plan_on_date['План'].sum()
-    top_plan_branch = main_plan_on_date.sort_values('План', ascending=False).head(3)
-    if filter_temp == "almaty":
-        number_plan_d = main_plan_on_date[
-            main_plan_on_date['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        number_plan = number_plan_d['План'].sum()
-        top_plan_branch = number_plan_d.sort_values('План', ascending=False).head(3)
-    elif filter_temp == "branch":
-        number_plan_d = main_plan_on_date[
-            ~main_plan_on_date['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        number_plan = number_plan_d['План'].sum()
-        top_plan_branch = number_plan_d.sort_values('План', ascending=False).head(3)
-
-    #   Calc completed cases
-    df_temp_completed = df_main_jornal[
-        (df_main_jornal['Дата заключения УМОД'].notna()) | (df_main_jornal['Статус ДМОД'].notna())]
-    df_temp_completed = df_temp_completed[
-        (df_temp_completed['Статус ДМОД'].str.contains('исполне'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('не требует'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('высвобождены'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('Заключ'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('согласован'))
-        | (df_temp_completed['Дата заключения УМОД'].notna())]
-    df_temp_completed = df_temp_completed[df_temp_completed['Статус ДМОД'] != 'залог в г.Тараз']
-    main_completed_on_date = calc_completed(df_temp_completed, date_string_end)
 
-    #   Calc remained cases
-    df_substr_ = pd.merge(main_plan_on_date, main_completed_on_date, how='inner', on='Филиал исполнитель ДМОД')
-    df_substr_['Осталось'] = df_substr_['План'] - df_substr_['Выполнено']
-    df_substr_ = df_substr_[['Филиал исполнитель ДМОД', 'Осталось']]
-    top_remained_branch = df_substr_.sort_values('Осталось', ascending=False).head(3)
+def source_files(year):
+    return SOURCE_JORNAL_TEMPLATE.format(year=year), SOURCE_MON_TEMPLATE.format(year=year)
 
-    #   Calc list of expired cases
-    list_expired_branch = calc_list_expired(df_main_jornal, date_rep.strftime("%m"))
 
-    #   Calc top of expired cases
-    top_expired_branch = calc_top_expired(df_main_jornal, date_rep.strftime("%m"))
-    top_expired_branch = top_expired_branch.sort_values('Просрочено', ascending=False).head(3)
+#   Files of the report year
+filename1, filename3 = source_files(REPORT_YEAR)
 
-    number_completed = main_completed_on_date['Выполнено'].sum()
-    top_completed_branch = main_completed_on_date.sort_values('Выполнено', ascending=False).head(3)
-    if filter_temp == "almaty":
-        number_completed_d = main_completed_on_date[
-            main_completed_on_date['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        number_completed = number_completed_d['Выполнено'].sum()
-        top_completed_branch = number_completed_d.sort_values('Выполнено', ascending=False).head(3)
 
-        df_substr_ = df_substr_[df_substr_['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        top_remained_branch = df_substr_.sort_values('Осталось', ascending=False).head(3)
+def update_report_year():
+    #   The dashboard runs past 1 January: the new year is shown, the old one goes to the history
+    global REPORT_YEAR, filename1, filename3
 
-        top_expired_branch = top_expired_branch[top_expired_branch['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        top_expired_branch = top_expired_branch.sort_values('Просрочено', ascending=False).head(3)
-    elif filter_temp == "branch":
-        number_completed_d = main_completed_on_date[
-            ~main_completed_on_date['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        number_completed = number_completed_d['Выполнено'].sum()
-        top_completed_branch = number_completed_d.sort_values('Выполнено', ascending=False).head(3)
-        df_substr_ = df_substr_[~df_substr_['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        top_remained_branch = df_substr_.sort_values('Осталось', ascending=False).head(3)
-        top_expired_branch = top_expired_branch[~top_expired_branch['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-        top_expired_branch = top_expired_branch.sort_values('Просрочено', ascending=False).head(3)
-
-    #   Write to file (work-spreadsheet)
-    write_to_csv(df_main_jornal)
-
-    #   Filter by types of query (branches, Almaty etc)
-    if filter_temp == "almaty":
-        df_main_jornal = df_main_jornal[df_main_jornal['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-    elif filter_temp == "branch":
-        df_main_jornal = df_main_jornal[~df_main_jornal['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-
-    #   Make list of "completed"
-    df_main_jornal_completed = df_main_jornal[
-        (df_main_jornal['Дата заключения УМОД'].notna()) | (df_main_jornal['Статус ДМОД'].notna())]
-    df_main_jornal_completed = df_main_jornal_completed[
-        (df_main_jornal_completed['Статус ДМОД'].str.contains('исполне'))
-        | (df_main_jornal_completed['Статус ДМОД'].str.contains('не требует'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('высвобождены'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('Заключ'))
-        | (df_temp_completed['Статус ДМОД'].str.contains('согласован'))
-        | (df_main_jornal_completed['Дата заключения УМОД'].notna())]
-    df_main_jornal_completed = df_main_jornal_completed[df_main_jornal_completed['Статус ДМОД'] != 'залог в г.Тараз']
+    year = date.today().year
+    if year != REPORT_YEAR:
+        print("Report year " + str(REPORT_YEAR) + " is over, the files of " + str(year) + " are read")
+        REPORT_YEAR = year
+        filename1, filename3 = source_files(year)
 
-    # ---------------------------------------------------------------------
-    #   Make work dataframes
-    # ---------------------------------------------------------------------
-    #   Make year total plan dataframe
-    df_plan_year = calc_plan_year(df_main_jornal)
 
-    #   Make dataframe of completed monitoring cases
-    df_compl_year = calc_compl_year(df_main_jornal_completed)
+# -------------------------------------------------------------------------
+#   Column types of the main dataframe
+# -------------------------------------------------------------------------
+#   Texts repeated in many rows (branches, statuses, employees, months): each text is kept once
+CATEGORY_COLUMNS = ['Филиал исполнитель ДМОД', 'Филиал Банка (рассмотрения заявки)', 'Статус залога',
+                    'Статус ДМОД', 'График (месяц)', 'График скорректированный (месяц)',
+                    'Ф.И.О. исполнителя', 'Ф.И.О. согласующего', 'Исполнитель', 'Согласующий Куратор',
+                    'Согласующий Начальник отдела', 'Согласующий Начальник Управления', 'Уникальность обеспечения']
+DATE_COLUMNS = ['Дата заключения ДМОД ', 'Дата заключения УМОД']
+DURATION_COLUMNS = ['Время затраченное на заключение Исполнителем', 'Время затраченное на согласование куратором']
+#   Calculated at loading, not written to the CSV file
+CALCULATED_COLUMNS = ['Номер месяца', 'Номер месяца (скорректированный)', 'Алматы', 'Выполнено']
+#   Statuses of completed cases ("Статус ДМОД"), the cases of Тараз are not counted
+COMPLETED_STATUS = re.compile('исполне|не требует|высвобождены|Заключ|согласован')
+EXCLUDED_STATUS = 'залог в г.Тараз'
+
+
+def set_jornal_types(df_temp):
+    df_temp = df_temp.copy()
+
+    for column in DATE_COLUMNS:
+        df_temp[column] = pd.to_datetime(df_temp[column], errors='coerce')
+    for column in DURATION_COLUMNS:
+        df_temp[column] = parse_duration(df_temp[column])
+    for column in CATEGORY_COLUMNS:
+        df_temp[column] = text_category(df_temp[column])
+
+    #   Text columns may hold numbers or dates typed by hand, keep them as text (NaN stays NaN)
+    for column in df_temp.columns[df_temp.dtypes == object]:
+        df_temp[column] = df_temp[column].where(df_temp[column].isna(), df_temp[column].astype(str))
+
+    #   Numbers of months: "planned up to the month" is a comparison of numbers
+    corrected = month_number(df_temp['График скорректированный (месяц)'])
+    df_temp['Номер месяца (скорректированный)'] = corrected
+    df_temp['Номер месяца'] = corrected.where(df_temp['График скорректированный (месяц)'].notna(),
+                                              month_number(df_temp['График (месяц)']))
+
+    #   Branches of Almaty
+    df_temp['Алматы'] = text_matches(df_temp['Филиал исполнитель ДМОД'], 'Алматы')
+
+    #   Completed cases
+    df_temp['Выполнено'] = completed_flag(df_temp)
+    return df_temp
+
+
+def text_category(column):
+    #   Category of the column as text: each distinct value is made text once, not each row (NaN stays NaN)
+    if column.dtype != object:
+        return column.astype('category')
+    codes, uniques = pd.factorize(column)
+    if len(uniques) == 0:
+        #   Empty column (no corrections yet, a journal of a new year)
+        return column.astype('category')
+    text_codes, categories = pd.factorize(pd.Index(uniques, dtype=object).astype(str))
+    codes = np.where(codes >= 0, text_codes[np.maximum(codes, 0)], -1)
+    values = pd.Categorical.from_codes(codes, categories).reorder_categories(np.sort(categories.to_numpy()))
+    return pd.Series(values, index=column.index, name=column.name)
+
+
+def category_memory_report(df_temp):
+    #   Memory of the category columns and of the same columns as text
+    columns = [column for column in CATEGORY_COLUMNS if column in df_temp.columns]
+    as_category = df_temp[columns].memory_usage(index=False, deep=True).sum() / 2 ** 20
+    as_text = df_temp[columns].astype(object).memory_usage(index=False, deep=True).sum() / 2 ** 20
+    return "Category columns: {:.1f} MB, as text {:.1f} MB ({:.0%} less)".format(
+        as_category, as_text, 1 - as_category / as_text if as_text else 0)
+
+
+def text_matches(column, pattern):
+    #   Rows of the column matching the regular expression (NaN does not match)
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        #   Each category is checked once, the rows take the result of their category (code -1 of NaN is the last)
+        matched = np.asarray(column.cat.categories.astype(str).str.contains(pattern), dtype=bool)
+        return pd.Series(np.append(matched, False)[column.cat.codes.to_numpy()], index=column.index)
+    return column.str.contains(pattern, na=False).astype(bool)
+
+
+def completed_flag(df_temp):
+    #   Completed: the status says so or the case has a date of УМОД
+    status = df_temp['Статус ДМОД']
+    completed = text_matches(status, COMPLETED_STATUS) | df_temp['Дата заключения УМОД'].notna()
+    return (completed & (status != EXCLUDED_STATUS)).astype(bool)
 
-    #   Calc expired
-    number_expired = calc_expired(df_plan_year, df_compl_year, date_rep.strftime("%m"))
 
-    #   Plan and completed by branches
-    plan_on_date = calc_plan(df_main_jornal, date_string_end)
-    completed_on_date = calc_completed(df_main_jornal_completed, date_string_end)
+# -------------------------------------------------------------------------
+#   Columnar cache of the main dataframe: cache/main_jornal.feather
+#   and the signature of the source files it was made from
+# -------------------------------------------------------------------------
+#   Change the version when the columns or their types are changed
+JORNAL_CACHE_VERSION = 7
+JORNAL_CACHE_DIR = 'cache'
+JORNAL_CACHE_FILE = os.path.join(JORNAL_CACHE_DIR, 'main_jornal.feather')
+JORNAL_CACHE_META = os.path.join(JORNAL_CACHE_DIR, 'main_jornal.json')
+
+
+def sources_stat(filenames=None):
+    stats = []
+    for filename in filenames or (filename1, filename3):
+        try:
+            stat = os.stat(filename)
+            stats.append([filename, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            stats.append([filename, None, None])
+    return stats
+
+
+def read_jornal_cache(stats):
+    if feather is None:
+        return None
+    try:
+        with open(JORNAL_CACHE_META, mode='r', encoding='utf-8') as file:
+            meta = json.load(file)
+        if meta.get('version') != JORNAL_CACHE_VERSION or meta.get('sources') != stats:
+            return None
+
+        time_start = time.perf_counter()
+        df_temp = feather.read_table(JORNAL_CACHE_FILE, memory_map=True).to_pandas()
+        print("File " + JORNAL_CACHE_FILE + " read in " + format(time.perf_counter() - time_start, '.2f') + " s")
+        return df_temp.set_index('index').rename_axis(None)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(e)
+        print("Can't read the cache '" + JORNAL_CACHE_FILE + "', the workbooks will be loaded")
+        return None
 
-    #   Make one dataframe
-    df_plan_completed = pd.merge(plan_on_date, completed_on_date, how='left', on='Филиал исполнитель ДМОД')
 
-    #   Change NaN to 0.0
-    df_plan_completed['Выполнено'] = df_plan_completed['Выполнено'].fillna(0)
-    df_plan_completed = df_plan_completed.sort_values(by=['План'], ascending=False)
+def write_jornal_cache(df_temp, stats):
+    if feather is None:
+        return
+    try:
+        os.makedirs(JORNAL_CACHE_DIR, exist_ok=True)
+
+        #   The old signature goes first, so a half-written cache is never taken
+        if os.path.exists(JORNAL_CACHE_META):
+            os.remove(JORNAL_CACHE_META)
+        feather.write_feather(df_temp.reset_index(), JORNAL_CACHE_FILE + '.tmp', compression='uncompressed')
+        os.replace(JORNAL_CACHE_FILE + '.tmp', JORNAL_CACHE_FILE)
+        with open(JORNAL_CACHE_META, mode='w', encoding='utf-8') as file:
+            json.dump({'version': JORNAL_CACHE_VERSION, 'sources': stats}, file, ensure_ascii=False)
+    except Exception as e:
+        print(e)
+        print("Can't write the cache '" + JORNAL_CACHE_FILE + "'")
 
-    #   Calc dataframe - year plan and completed cases by branches
-    if filter_branch == "all":
-        df_plan_year_branch = calc_plan_year(df_main_jornal)
-        df_compl_year_branch = calc_compl_year(df_main_jornal_completed)
-    else:
-        df_main_jornal_branch = df_main_jornal[df_main_jornal['Филиал исполнитель ДМОД'].str.contains(filter_branch)]
-        df_plan_year_branch = calc_plan_year(df_main_jornal_branch)
-        df_main_jornal_completed_branch = df_main_jornal_completed[
-            df_main_jornal_completed['Филиал исполнитель ДМОД'].str.contains(filter_branch)]
-        df_compl_year_branch = calc_compl_year(df_main_jornal_completed_branch)
-
-    #   Make branches list for dropdown element
-    df_plan_completed_temp = df_plan_completed
-    if filter_temp == "almaty":
-        df_plan_completed_temp = df_plan_completed[df_plan_completed['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-    elif filter_temp == "branch":
-        df_plan_completed_temp = df_plan_completed[~df_plan_completed['Филиал исполнитель ДМОД'].str.contains('Алматы')]
-    df_list_branch = df_plan_completed_temp["Филиал исполнитель ДМОД"].sort_values()
 
-    #   Find the leaders
-    df_top_leaders = top_leaders(df_main_jornal_completed, date_string_start, date_string_end)
-    df_top_leaders = df_top_leaders.sort_values(by=['Количество'], ascending=[False])
-    df_top_leaders = df_top_leaders.head(20)
+# -------------------------------------------------------------------------
+#   Make main dataframe of a year from its two workbooks
+# -------------------------------------------------------------------------
+#   The status column is named by the year ("Статус залога 01.2023"), in the main dataframe it has one name
+STATUS_COLUMN = 'Статус залога'
+STATUS_COLUMN_PREFIX = 'Статус залога 01.'
+JORNAL_COLUMNS = ['Код объекта залога', 'Наименование заемщика Сцепка',
+                  'Класс обеспечения', 'Наименование вида обеспечения', 'Месторасположение (Адрес)',
+                  'Стоимость НОК либо Банка', 'Филиал исполнитель ДМОД', STATUS_COLUMN,
+                  'График (месяц)', 'График скорректированный (месяц)', 'Статус ДМОД',
+                  'Ф.И.О. исполнителя', 'Ф.И.О. согласующего',
+                  'Дата заключения ДМОД ', 'Дата заключения УМОД',
+                  'Цель составления заключения', 'Филиал Банка (рассмотрения заявки)',
+                  'Исполнитель', 'Согласующий Куратор', 'Согласующий Начальник отдела',
+                  'Согласующий Начальник Управления', 'Уникальность обеспечения',
+                  'Время затраченное на заключение Исполнителем',
+                  'Время затраченное на согласование куратором',
+                  'В срок/просрочка по нормативному времени исполнителя',
+                  'В срок/просрочка по нормативному времени согласующего куратора']
+
+
+def merge_jornal(df_new_jornal, df_mon):
+    #   Merge two dataframes by column="Код объекта залога"
+    df_main_jornal = pd.merge(df_mon, df_new_jornal, how='left', left_on='Код объекта залога', right_on=' ID залога')
 
-    df_top_branches = top_branches(df_main_jornal_completed, date_string_start, date_string_end)
-    df_top_branches = df_top_branches.sort_values(by=['Количество'], ascending=[False])
-    df_top_branches = df_top_branches.head(7)
+    #   Pick columns, the status column of the year gets the common name
+    status_column = next((column for column in df_mon.columns if str(column).startswith(STATUS_COLUMN_PREFIX)),
+                         STATUS_COLUMN)
+    df_main_jornal = df_main_jornal[[status_column if column == STATUS_COLUMN else column
+                                     for column in JORNAL_COLUMNS]]
+    df_main_jornal.columns = JORNAL_COLUMNS
 
-    #   Leaders by branches
-    df_top_filials = completed_on_date.sort_values(by=['Выполнено', 'Филиал исполнитель ДМОД'],
-                                                   ascending=[False, True]).head(5)
+    df_main_jornal = df_main_jornal[(df_main_jornal[STATUS_COLUMN].str.contains('Принят'))]
 
-    #   Calculate completed cases by categories
-    number_masssegment_completed = len(df_main_jornal[df_main_jornal['Уникальность обеспечения'] == 'Mass segment'])
-    number_unique_completed = len(df_main_jornal[df_main_jornal['Уникальность обеспечения'] == 'Unique'])
-    number_interval_completed = len(df_main_jornal[df_main_jornal['Уникальность обеспечения'] == 'Interval'])
+    #   Dates, durations and categories are set once here, and kept in the cache
+    return set_jornal_types(df_main_jornal)
 
-    # Average time of monitoring
-    df_average_filials_r = average_filials_r(df_main_jornal_completed, date_string_start, date_string_end)
-    df_average_filials_r = df_average_filials_r.sort_values(by='Время затраченное на заключение Исполнителем')
 
-    # Average time of monitoring, according categories
-    df_average_filials_unique = average_filials_unique(df_main_jornal_completed, date_string_start, date_string_end)
-    df_average_filials_unique = df_average_filials_unique.sort_values(
-        by='Время затраченное на заключение Исполнителем_mean')
+# -------------------------------------------------------------------------
+#   Calculate, query ...
+# -------------------------------------------------------------------------
+@timed_stage
+def load_main_jornal():
+    #   Source files are not changed since the last run: take the columnar cache
+    stats = sources_stat()
+    df_main_jornal = read_jornal_cache(stats)
+    if df_main_jornal is not None:
+        return df_main_jornal
 
-    # Average time of approving
-    df_average_f_apr_r = average_f_apr_r(df_main_jornal_completed, date_string_start, date_string_end)
-    df_average_f_apr_r = df_average_f_apr_r.sort_values(by='Время затраченное на согласование куратором_mean')
+    # -------------------------------------------------------------------------
+    #   Load files (parsed again only if they were changed)
+    # -------------------------------------------------------------------------
+    df_new_jornal, df_mon = load_sources([(filename1, load_new_jornal), (filename3, load_mon)])
+    print(source_cache_report())
 
-    # Average time of approving, according categories
-    df_average_f_apr_unique = average_f_apr_unique(df_main_jornal_completed, date_string_start, date_string_end)
-    df_average_f_apr_unique = df_average_f_apr_unique.sort_values(by='Время затраченное на согласование куратором_mean')
+    df_main_jornal = merge_jornal(df_new_jornal, df_mon)
+    print(category_memory_report(df_main_jornal))
+    write_jornal_cache(df_main_jornal, stats)
+    return df_main_jornal
 
-    # Find the anti-leaders (outsiders) (maybe useful for future)
-    df_antitop_filials_r = antitop_filials_r(df_main_jornal_completed, date_string_start, date_string_end)
 
+# -------------------------------------------------------------------------
+#   Pick rows of the main filter ("all", "branch" or "almaty")
+# -------------------------------------------------------------------------
+FILTERS = ["all", "branch", "almaty"]
 
-# ---------------------------------------------------------------------
-#   Prepare graphs, bars and figures
-# ---------------------------------------------------------------------
-def prepare_fig(colors_temp):
-    global fig_main_plan_completed, fig_mass_unique_interval, fig_top_filials, fig_plan_compl_year, \
-        fig_plan_completed, fig_plan_completed_branch, fig_mass_unique_interval
-
-    #  Pie: Plan and Completed
-    fig_main_plan_completed = px.pie(values=[number_plan - number_completed, number_completed],
-                                     names=['Не исполнено', 'Исполнено'],
-                                     title='План и всего исполнено',
-                                     color_discrete_sequence=['rgb(117, 122, 130)', '#8ecf90']
-                                     )
-    fig_main_plan_completed.update_traces(hole=.65, hoverinfo='label+percent', textinfo='value')
-    fig_main_plan_completed.update_layout(
-        annotations=[dict(text="Всего " + str(number_plan), showarrow=False,
-                          font={'color': colors_temp['text']})],
-        plot_bgcolor='rgba(0, 0, 0, 0)', title_x=0.5,
-        margin=dict(t=40, b=40, l=40, r=40),
-        legend=dict(yanchor="top", y=0.99, xanchor="center", x=0.01),
-        paper_bgcolor='rgba(0, 0, 0, 0)',
-        font={'color': colors_temp['text']}
-    )
 
-    #  Mass, unique, interval
-    fig_mass_unique_interval = px.bar(x=["Mass Segment", "Unique", "Interval"],
-                                      y=[number_masssegment_completed, number_unique_completed,
-                                         number_interval_completed], text_auto='.2s',
-                                      title='Общее количество <BR> исполненых по категориям',
-                                      color_discrete_sequence=px.colors.sequential.Blugrn)
-    fig_mass_unique_interval.update_yaxes(title='Исполнено', visible=True, showticklabels=False)
-    fig_mass_unique_interval.update_xaxes(title='Категории', visible=True, showticklabels=True)
-    fig_mass_unique_interval.update_layout(plot_bgcolor='rgba(0, 0, 0, 0)', title_x=0.5,
-                                           margin=dict(t=50, b=0, l=20, r=20),
-                                           paper_bgcolor='rgba(0, 0, 0, 0)',
-                                           font={'color': colors_temp['text']})
-
-    #  Top of branches
-    fig_top_filials = px.bar(df_top_filials, x="Филиал исполнитель ДМОД", y="Выполнено", text_auto='.2s',
-                             height=400, width=400, color_discrete_map={'Исполнено': '#464646'})
-    fig_top_filials.update_layout(plot_bgcolor='rgba(0, 0, 0, 0)', paper_bgcolor='rgba(0, 0, 0, 0)',
-                                  title='Филиалы лидеры (кол-во исполненных)', title_x=0.5,
-                                  font={'color': colors_temp['text']})
-
-    #   Total number of completed monitoring cases
-    fig_plan_compl_year = go.Figure()
-    fig_plan_compl_year.add_trace(go.Bar(x=df_plan_year["Месяц"], y=df_plan_year["Количество"], name='План',
-                                         text=df_plan_year["Количество"]))
-    fig_plan_compl_year.add_trace(go.Bar(x=df_compl_year["Месяц"], y=df_compl_year["Количество"], name="Исполнено",
-                                         text=df_compl_year["Количество"]))
-    fig_plan_compl_year.update_traces(textfont_size=12, textangle=0, textposition="outside",
-                                      cliponaxis=False)
-    fig_plan_compl_year.update_layout(barmode='group', xaxis_tickangle=-45, height=500, width=700,
-                                      title='План мониторинга на год', title_x=0.5,
-                                      plot_bgcolor='rgba(0, 0, 0, 0)', paper_bgcolor='rgba(0, 0, 0, 0)',
-                                      font={'color': colors_temp['text']})
-
-    #   Completed monitoring cases by branches
-    fig_plan_completed = go.Figure()
-    fig_plan_completed.add_trace(go.Bar(x=df_plan_completed["Филиал исполнитель ДМОД"], y=df_plan_completed["План"],
-                                        name="План"))
-    fig_plan_completed.add_trace(
-        go.Bar(x=df_plan_completed["Филиал исполнитель ДМОД"], y=df_plan_completed["Выполнено"],
-               name="Исполнено", text=df_plan_completed["Выполнено"]))
-    fig_plan_completed.update_traces(textfont_size=12, textangle=0, textposition='outside', cliponaxis=False)
-    fig_plan_completed.update_layout(barmode='overlay', xaxis_tickangle=-45, height=500, width=700,
-                                     title='Исполнено объектов к плану по всему году', title_x=0.5,
-                                     plot_bgcolor='rgba(0, 0, 0, 0)', paper_bgcolor='rgba(0, 0, 0, 0)',
-                                     font={'color': colors_temp['text']})
-
-    #   Completed cases by branch
-    fig_plan_completed_branch = go.Figure()
-    fig_plan_completed_branch.add_trace(
-        go.Bar(x=df_plan_year_branch["Месяц"], y=df_plan_year_branch["Количество"], name='План',
-               text=df_plan_year_branch["Количество"]))
-    fig_plan_completed_branch.add_trace(
-        go.Bar(x=df_compl_year_branch["Месяц"], y=df_compl_year_branch["Количество"], name="Исполнено",
-               text=df_compl_year_branch["Количество"]))
-    fig_plan_completed_branch.update_traces(textfont_size=12, textangle=0, textposition="outside",
-                                            cliponaxis=False)
-    fig_plan_completed_branch.update_layout(barmode='group', xaxis_tickangle=-45, height=500, width=700,
-                                            title='План мониторинга на год по выбранному филиалу', title_x=0.5,
-                                            plot_bgcolor='rgba(0, 0, 0, 0)', paper_bgcolor='rgba(0, 0, 0, 0)',
-                                            font={'color': colors_temp['text']})
+def select_view(df_temp, filter_temp, almaty_mask):
+    if filter_temp == "almaty":
+        return df_temp[almaty_mask]
+    elif filter_temp == "branch":
+        return df_temp[~almaty_mask]
+    return df_temp
 
 
-colors = {
-    'background': '#c4e6c5',
-    'tabletext': '#2d124d',
-    'text': '#2d124d'
-}
-make_calc("all", "all")
-prepare_fig(colors)
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.ZEPHYR])
-app.title = "Мониторинг"
+def select_branches(df_temp, filter_temp, almaty_branches, column='Филиал исполнитель ДМОД'):
+    return select_view(df_temp, filter_temp, df_temp[column].isin(almaty_branches))
 
-#   Title of dashboard
-header = html.H2(id='output-container-title', style={'textAlign': 'center'})
 
-app.layout = dbc.Container([
-    html.Div(style={
-        'background-image': 'url("/assets/background2.jpg")',
-    }, children=[
-        header,
-        dbc.Row([
-            #   First column (width 2)
-            dbc.Col([
-                dbc.Card([
-                    dcc.Graph(
-                        id='graph-main_plan_completed',
-                        figure=fig_main_plan_completed
-                    ),
-                    dbc.Label("Фильтр:", style={'color': colors['text'], 'margin-left': '15px'}),
-                    dcc.Dropdown([
-                        {'label': 'Вместе г.Алматы + филиальная сеть', 'value': 'all'},
-                        {'label': 'Филиальная сеть', 'value': 'branch'},
-                        {'label': 'г. Алматы', 'value': 'almaty'}
-                    ],
-                        'all', id='filter-dropdown',
-                        clearable=False, style={'color': "#111111", 'verticalAlign': 'bottom',
-                                                'margin-left': '5px', 'margin-right': '15px'}),
-                    html.Br(),
-                    html.Button(id='submit-button-state', n_clicks=0, children='Обновить',
-                                type="button",
-                                style={'font-size': '12px', 'width': '140px', 'height': '35px',
-                                       'display': 'inline-block',
-                                       'margin-left': '10px'
-                                       }
-                                ),
-                    dcc.Graph(
-                        id='graph-mass_unique_interval',
-                        figure=fig_mass_unique_interval
-                    ),
-                    html.Br(),
-                    html.Img(src='/assets/logo.jpg'),
-                ], color="success", outline=True),
-            ], width=2),
-            #   Second column (width 10)
-            dbc.Col([
-                dbc.Card([
-                    dbc.Row([
-                        dbc.Col(
-                            dbc.Card([
-                                dbc.CardHeader("План"),
-                                dbc.CardBody(
-                                    [
-                                        dbc.Row([
-                                            dbc.Col([
-                                                html.H1(html.B(id='card_plan')),
-                                            ]),
-                                            dbc.Col([
-                                                dash_table.DataTable(style_data={'whiteSpace': 'normal',
-                                                                                 'height': 'auto',
-                                                                                 # 'border': 'none'
-                                                                                 },
-                                                                     id='output-data-table-plan',
-                                                                     data=top_plan_branch.to_dict('records'),
-                                                                     style_header={'fontWeight': 'bold'},
-                                                                     style_cell={'textAlign': 'center',
-                                                                                 'backgroundColor': 'transparent',
-                                                                                 'color': colors['tabletext'],
-                                                                                 'font_size': '12px',
-                                                                                 'whiteSpace': 'normal',
-                                                                                 'height': 'auto'},
-                                                                     columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                               'name': ['Филиал']},
-                                                                              {'id': 'План', 'name': ['План']}],
-                                                                     ),
-                                            ])
-                                        ])
-                                    ]
-                                ),
-                            ], color="success", outline=False, inverse=True),
-                            width=3,
+# -------------------------------------------------------------------------
+#   Counts of one main filter from counts by (key, 'Алматы')
+# -------------------------------------------------------------------------
+def view_counts(counts_temp, filter_temp):
+    counts_temp = select_view(counts_temp, filter_temp, counts_temp.index.get_level_values('Алматы'))
+    return counts_temp.groupby(level=0, observed=True).sum()
+
+
+# -------------------------------------------------------------------------
+#   Month of the report: expired are the cases planned before it
+# -------------------------------------------------------------------------
+def report_month(date_rep):
+    if date_rep.year < date.today().year:
+        #   The year is over: the plan of every month is expired
+        return '13'
+    return date_rep.strftime("%m")
+
+
+# -------------------------------------------------------------------------
+#   Completed cases of the main dataframe
+# -------------------------------------------------------------------------
+def completed_rows(df_main_jornal):
+    return df_main_jornal[df_main_jornal['Выполнено']]
+
+
+# -------------------------------------------------------------------------
+#   Aggregate cube: rows and filled cells of "График (месяц)" by branch, month, statuses and uniqueness.
+#   Cards, tables and figures are slices of the cube. Cubes of parts of the dataframe are added up,
+#   so on refresh only the changed rows are counted
+# -------------------------------------------------------------------------
+CUBE_DIMENSIONS = ['Филиал исполнитель ДМОД', 'Алматы', 'Месяц', 'Номер месяца', 'Номер месяца (скорректированный)',
+                   'Статус залога', 'Статус ДМОД', 'Уникальность обеспечения', 'Выполнено']
+
+
+def count_cube(df_temp):
+    keys = [df_temp['Филиал исполнитель ДМОД'], df_temp['Алматы'], plan_month(df_temp), df_temp['Номер месяца'],
+            df_temp['Номер месяца (скорректированный)'], df_temp['Статус залога'], df_temp['Статус ДМОД'],
+            df_temp['Уникальность обеспечения'], df_temp['Выполнено']]
+    grouped = df_temp.groupby(keys, observed=True, dropna=False)['График (месяц)']
+    cube = pd.DataFrame({'rows': grouped.size(), 'cells': grouped.count()}).reset_index()
+
+    #   Plain values, not categories: cubes of frames with other categories are added up
+    return cube.astype({column: object for column in CUBE_DIMENSIONS
+                        if isinstance(cube[column].dtype, pd.CategoricalDtype)})
+
+
+def add_cube(cube, cube_removed, cube_added):
+    cube = pd.concat([cube, cube_removed.assign(rows=-cube_removed['rows'], cells=-cube_removed['cells']),
+                      cube_added], ignore_index=True)
+    cube = cube.groupby(CUBE_DIMENSIONS, dropna=False, sort=False)[['rows', 'cells']].sum().reset_index()
+    return cube[cube['rows'] > 0].reset_index(drop=True)
+
+
+def cube_counts(cube, keys, measure='cells'):
+    #   Keys with empty values are not counted, as by groupby() of the dataframe
+    return cube.groupby(keys)[measure].sum()
+
+
+def cube_plan(cube):
+    return cube[months_up_to(cube['Номер месяца'], 12) & (cube['Статус залога'] == 'Принят к учету')]
+
+
+def cube_completed(cube):
+    return cube[cube['Выполнено']]
+
+
+def cube_completed_planned(cube):
+    #   Completed cases planned in the months of the year, as the plan
+    return cube_completed(cube[months_up_to(cube['Номер месяца'], 12)])
+
+
+def cube_expired(cube, month_temp):
+    return cube[months_up_to(cube['Номер месяца (скорректированный)'], int(month_temp) - 1)
+                & cube['Статус ДМОД'].isna()]
+
+
+# -------------------------------------------------------------------------
+#   Rows of the objects which were added, changed or removed since the last refresh
+# -------------------------------------------------------------------------
+def object_hashes(df_temp):
+    #   An object may have some rows (one for every request): the sum of hashes does not depend on their order
+    hashes = pd.util.hash_pandas_object(df_temp, index=False)
+    return hashes.groupby(df_temp['Код объекта залога'].to_numpy(), dropna=False).sum()
+
+
+@timed_stage
+def update_cube(cube_state, df_main_jornal):
+    schema = tuple((column, str(dtype)) for column, dtype in df_main_jornal.dtypes.items())
+    hashes = object_hashes(df_main_jornal)
+
+    #   First run, other columns or types: the cube is made again
+    if cube_state is None or cube_state['schema'] != schema:
+        return {'cube': count_cube(df_main_jornal), 'schema': schema, 'hashes': hashes, 'jornal': df_main_jornal}
+
+    old_hashes = cube_state['hashes']
+    inserted = hashes.index.difference(old_hashes.index)
+    deleted = old_hashes.index.difference(hashes.index)
+    common = hashes.index.intersection(old_hashes.index)
+    updated = common[hashes[common].to_numpy() != old_hashes[common].to_numpy()]
+    print("Changed objects: inserted=" + str(len(inserted)) + ", updated=" + str(len(updated)) + ", deleted="
+          + str(len(deleted)))
+
+    cube = cube_state['cube']
+    changed = inserted.append(updated).append(deleted)
+    if len(changed):
+        df_old = cube_state['jornal']
+        cube = add_cube(cube, count_cube(df_old[df_old['Код объекта залога'].isin(changed)]),
+                        count_cube(df_main_jornal[df_main_jornal['Код объекта залога'].isin(changed)]))
+    return {'cube': cube, 'schema': schema, 'hashes': hashes, 'jornal': df_main_jornal}
+
+
+# -------------------------------------------------------------------------
+#   Calculate, query ... for all main filters at once
+# -------------------------------------------------------------------------
+@timed_stage
+def make_calc(df_main_jornal, date_rep=None, cube_state=None):
+    #   Initializing range: the report year is shown on today, an earlier year on its last day
+    date_rep = date_rep or date.today()
+    year_rep = date_rep.strftime("%Y")
+    month_rep = report_month(date_rep)
+    date_string_start = "01.01." + year_rep
+    date_string_end = "31.12." + year_rep
+    date_string_today = 'Экран выполнения мониторинга объектов залога в ' + year_rep + ' г. на : ' \
+                        + date_rep.strftime('%d.%m.%Y')
+
+    #   Rows of Almaty are tagged at loading, the views "branch" and "almaty" are made by this flag
+    almaty_branches = df_main_jornal.loc[df_main_jornal['Алматы'], 'Филиал исполнитель ДМОД'].unique()
+
+    # ---------------------------------------------------------------------
+    #   Grouped intermediates for all views
+    # ---------------------------------------------------------------------
+    #   Plan, completed and expired by branches and months are slices of the cube
+    if cube_state is None:
+        cube_state = update_cube(None, df_main_jornal)
+    cube = cube_state['cube']
+    main_plan_on_date = cube_counts(cube_plan(cube), 'Филиал исполнитель ДМОД').rename('План').reset_index()
+    main_completed_on_date = cube_counts(cube_completed_planned(cube), 'Филиал исполнитель ДМОД').rename(
+        'Выполнено').reset_index()
+
+    #   Calc remained cases
+    df_substr_ = pd.merge(main_plan_on_date, main_completed_on_date, how='inner', on='Филиал исполнитель ДМОД')
+    df_substr_['Осталось'] = df_substr_['План'] - df_substr_['Выполнено']
+    df_substr_ = df_substr_[['Филиал исполнитель ДМОД', 'Осталось']]
+
+    #   Calc top of expired cases
+    main_top_expired = cube_counts(cube_expired(cube, month_rep), 'Филиал исполнитель ДМОД', 'rows').rename(
+        'Просрочено').reset_index()
+    main_top_expired = main_top_expired.sort_values('Просрочено', ascending=False).head(3)
+
+    #   Year plan and completed cases by months
+    plan_month_counts = cube_counts(cube, ['Месяц', 'Алматы'])
+    compl_month_counts = cube_counts(cube_completed(cube), ['Месяц', 'Алматы'])
+
+    #   Completed cases by categories
+    unique_counts = cube_counts(cube, ['Уникальность обеспечения', 'Алматы'], 'rows')
+
+    # ---------------------------------------------------------------------
+    #   Views: the header and what the tabs are made of, the tabs are made when they are opened
+    # ---------------------------------------------------------------------
+    views = {}
+    for filter_temp in FILTERS:
+        plan_on_date = select_branches(main_plan_on_date, filter_temp, almaty_branches)
+        completed_on_date = select_branches(main_completed_on_date, filter_temp, almaty_branches)
+
+        number_plan = plan_on_date['План'].sum()
+        top_plan_branch = plan_on_date.sort_values('План', ascending=False).head(3)
+        number_completed = completed_on_date['Выполнено'].sum()
+        top_completed_branch = completed_on_date.sort_values('Выполнено', ascending=False).head(3)
+        top_remained_branch = select_branches(df_substr_, filter_temp, almaty_branches).sort_values(
+            'Осталось', ascending=False).head(3)
+        top_expired_branch = select_branches(main_top_expired, filter_temp, almaty_branches).sort_values(
+            'Просрочено', ascending=False).head(3)
+
+        #   Make year total plan dataframe and dataframe of completed monitoring cases
+        df_plan_year = year_table(view_counts(plan_month_counts, filter_temp))
+        df_compl_year = year_table(view_counts(compl_month_counts, filter_temp))
+
+        #   Calc expired
+        number_expired = calc_expired(df_plan_year, df_compl_year, month_rep)
+
+        #   Calculate completed cases by categories
+        unique_view = view_counts(unique_counts, filter_temp)
+        number_masssegment_completed = int(unique_view.get('Mass segment', 0))
+        number_unique_completed = int(unique_view.get('Unique', 0))
+        number_interval_completed = int(unique_view.get('Interval', 0))
+
+        views[filter_temp] = {
+            'filter': filter_temp, 'date_string_today': date_string_today,
+            'date_string_start': date_string_start, 'date_string_end': date_string_end, 'month_rep': month_rep,
+            'df_main_jornal': df_main_jornal, 'almaty_branches': almaty_branches, 'cube': cube,
+            'number_plan': number_plan, 'top_plan_branch': top_plan_branch,
+            'number_completed': number_completed, 'top_completed_branch': top_completed_branch,
+            'top_remained_branch': top_remained_branch,
+            'number_expired': number_expired, 'top_expired_branch': top_expired_branch,
+            'df_plan_year': df_plan_year, 'df_compl_year': df_compl_year,
+            'plan_on_date': plan_on_date, 'completed_on_date': completed_on_date,
+            'number_masssegment_completed': number_masssegment_completed,
+            'number_unique_completed': number_unique_completed,
+            'number_interval_completed': number_interval_completed}
+    return views
+
+
+# -------------------------------------------------------------------------
+#   Parts of the tabs: each is made for all main filters when its tab is opened first,
+#   and kept with the snapshot. A part gets the views and the parts made before it
+# -------------------------------------------------------------------------
+@timed_stage
+def calc_part_completed(views, parts):
+    #   Make list of "completed" (the same for all views)
+    return {'all': {'df_main_jornal_completed': completed_rows(views['all']['df_main_jornal'])}}
+
+
+@timed_stage
+def calc_part_year_plan(views, parts):
+    return {filter_temp: {'fig_plan_compl_year': make_fig_plan_compl_year(calc, colors)}
+            for filter_temp, calc in views.items()}
+
+
+@timed_stage
+def calc_part_top(views, parts):
+    calc_all = views['all']
+    df_main_jornal_completed = parts['completed']['all']['df_main_jornal_completed']
+    leaders_counts = count_in_period(df_main_jornal_completed, ['Ф.И.О. исполнителя', 'Алматы'],
+                                     calc_all['date_string_start'], calc_all['date_string_end'])
+    branches_counts = count_in_period(df_main_jornal_completed, ['Филиал Банка (рассмотрения заявки)', 'Алматы'],
+                                      calc_all['date_string_start'], calc_all['date_string_end'])
+
+    part = {}
+    for filter_temp, calc in views.items():
+        #   Find the leaders
+        df_top_leaders = top_leaders(view_counts(leaders_counts, filter_temp))
+        df_top_leaders = df_top_leaders.sort_values(by=['Количество'], ascending=[False])
+        df_top_leaders = df_top_leaders.head(20)
+
+        df_top_branches = top_branches(view_counts(branches_counts, filter_temp))
+        df_top_branches = df_top_branches.sort_values(by=['Количество'], ascending=[False])
+        df_top_branches = df_top_branches.head(7)
+
+        #   Leaders by branches
+        df_top_filials = calc['completed_on_date'].sort_values(by=['Выполнено', 'Филиал исполнитель ДМОД'],
+                                                               ascending=[False, True]).head(5)
+        part[filter_temp] = {'df_top_leaders': df_top_leaders, 'df_top_branches': df_top_branches,
+                             'df_top_filials': df_top_filials,
+                             'fig_top_filials': make_fig_top_filials({'df_top_filials': df_top_filials}, colors)}
+    return part
+
+
+@timed_stage
+def calc_part_average_time(views, parts):
+    #   Average time (by branch, so every view is a part of it)
+    calc_all = views['all']
+    main_average_filials_r, main_average_filials_unique, main_average_f_apr_r, main_average_f_apr_unique = \
+        average_times(parts['completed']['all']['df_main_jornal_completed'], calc_all['date_string_start'],
+                      calc_all['date_string_end'])
+
+    part = {}
+    for filter_temp, calc in views.items():
+        almaty_branches = calc['almaty_branches']
+
+        # Average time of monitoring
+        df_average_filials_r = select_branches(main_average_filials_r, filter_temp, almaty_branches)
+        df_average_filials_r = df_average_filials_r.sort_values(by='Время затраченное на заключение Исполнителем')
+
+        # Average time of monitoring, according categories
+        df_average_filials_unique = select_branches(main_average_filials_unique, filter_temp, almaty_branches,
+                                                    'Филиал исполнитель ДМОД_')
+        df_average_filials_unique = df_average_filials_unique.sort_values(
+            by='Время затраченное на заключение Исполнителем_mean')
+
+        # Average time of approving
+        df_average_f_apr_r = select_branches(main_average_f_apr_r, filter_temp, almaty_branches,
+                                             'Филиал исполнитель ДМОД_')
+        df_average_f_apr_r = df_average_f_apr_r.sort_values(by='Время затраченное на согласование куратором_mean')
+
+        # Average time of approving, according categories
+        df_average_f_apr_unique = select_branches(main_average_f_apr_unique, filter_temp, almaty_branches,
+                                                  'Филиал исполнитель ДМОД_')
+        df_average_f_apr_unique = df_average_f_apr_unique.sort_values(
+            by='Время затраченное на согласование куратором_mean')
+
+        part[filter_temp] = {'df_average_filials_r': df_average_filials_r,
+                             'df_average_filials_unique': df_average_filials_unique,
+                             'df_average_f_apr_r': df_average_f_apr_r,
+                             'df_average_f_apr_unique': df_average_f_apr_unique}
+    return part
+
+
+@timed_stage
+def calc_part_plan_completed(views, parts):
+    part = {}
+    for filter_temp, calc in views.items():
+        #   Make one dataframe
+        df_plan_completed = pd.merge(calc['plan_on_date'], calc['completed_on_date'], how='left',
+                                     on='Филиал исполнитель ДМОД')
+
+        #   Change NaN to 0.0
+        df_plan_completed['Выполнено'] = df_plan_completed['Выполнено'].fillna(0)
+        df_plan_completed = df_plan_completed.sort_values(by=['План'], ascending=False)
+
+        #   Make branches list for dropdown element
+        df_list_branch = df_plan_completed["Филиал исполнитель ДМОД"].sort_values()
+
+        part[filter_temp] = {
+            'df_plan_completed': df_plan_completed, 'df_list_branch': df_list_branch,
+            'fig_plan_completed': make_fig_plan_completed({'df_plan_completed': df_plan_completed}, colors),
+            'fig_plan_completed_branch': make_fig_plan_completed_branch(*calc_branch(calc, "all"), colors)}
+    return part
+
+
+@timed_stage
+def calc_part_list_expired(views, parts):
+    #   Calc list of expired cases (the same for all views)
+    calc_all = views['all']
+    return {'all': {'list_expired_branch': calc_list_expired(calc_all['df_main_jornal'], calc_all['month_rep'])}}
+
+
+#   In the order they are made: a part may use the parts above it
+PART_CALCS = {'completed': calc_part_completed, 'year_plan': calc_part_year_plan, 'top': calc_part_top,
+              'average_time': calc_part_average_time, 'plan_completed': calc_part_plan_completed,
+              'list_expired': calc_part_list_expired}
+
+#   Parts each tab needs
+TAB_PARTS = {'year_plan_tab': ['year_plan'], 'top_tab': ['completed', 'top'],
+             'average_time_tab': ['completed', 'average_time'], 'completed_tab': ['plan_completed'],
+             'expired_tab': ['list_expired']}
+
+tab_parts_lock = threading.Lock()
+
+
+def make_part(views, parts, part):
+    if part not in parts:
+        with tab_parts_lock:
+            if part not in parts:
+                parts[part] = PART_CALCS[part](views, parts)
+    return parts[part]
+
+
+# -------------------------------------------------------------------------
+#   Calc dataframe - year plan and completed cases by branches
+# -------------------------------------------------------------------------
+@timed_stage
+def calc_branch(calc, filter_branch):
+    if filter_branch == "all":
+        return calc['df_plan_year'], calc['df_compl_year']
+
+    #   The cube is shared by all views: pick the branch, then the rows of this view
+    cube = calc['cube']
+    cube_branch = cube[cube['Филиал исполнитель ДМОД'].str.contains(filter_branch, na=False)]
+    cube_branch = select_view(cube_branch, calc['filter'], cube_branch['Алматы'])
+    df_plan_year_branch = year_table(cube_counts(cube_branch, 'Месяц'))
+    df_compl_year_branch = year_table(cube_counts(cube_completed(cube_branch), 'Месяц'))
+    return df_plan_year_branch, df_compl_year_branch
+
+
+# ---------------------------------------------------------------------
+#   Template of all figures: transparent backgrounds, centered titles and what the figures use of the
+#   "plotly" template. The full "plotly" template is 7 KB in the JSON of every figure
+# ---------------------------------------------------------------------
+def make_figure_template():
+    plotly_template = pio.templates['plotly']
+    layout = {name: plotly_template.layout[name] for name in ['autotypenumbers', 'colorway', 'hovermode',
+                                                               'hoverlabel', 'annotationdefaults',
+                                                               'xaxis', 'yaxis']}
+    return go.layout.Template(
+        layout=dict(layout, plot_bgcolor='rgba(0, 0, 0, 0)', paper_bgcolor='rgba(0, 0, 0, 0)', title_x=0.5),
+        data={'bar': plotly_template.data.bar, 'pie': plotly_template.data.pie})
+
+
+pio.templates['dashboard'] = make_figure_template()
+pio.templates.default = 'dashboard'
+
+
+# ---------------------------------------------------------------------
+#   Update of a figure the browser already has: only the data of the traces and the annotations are sent
+# ---------------------------------------------------------------------
+PATCH_TRACE_KEYS = ['x', 'y', 'text', 'labels', 'values']
+
+
+def figure_patch(fig):
+    patch = Patch()
+    for index, trace in enumerate(fig.data):
+        for key in PATCH_TRACE_KEYS:
+            if key in trace and trace[key] is not None:
+                patch['data'][index][key] = trace[key]
+    if fig.layout.annotations:
+        patch['layout']['annotations'] = fig.layout.annotations
+    return patch
+
+
+def figure_update(fig, patch):
+    return figure_patch(fig) if patch else fig
+
+
+# ---------------------------------------------------------------------
+#   Pie: Plan and Completed
+# ---------------------------------------------------------------------
+def make_fig_main_plan_completed(calc, colors_temp):
+    fig = px.pie(values=[calc['number_plan'] - calc['number_completed'], calc['number_completed']],
+                 names=['Не исполнено', 'Исполнено'],
+                 title='План и всего исполнено',
+                 color_discrete_sequence=['rgb(117, 122, 130)', '#8ecf90']
+                 )
+    fig.update_traces(hole=.65, hoverinfo='label+percent', textinfo='value')
+    fig.update_layout(
+        annotations=[dict(text="Всего " + str(calc['number_plan']), showarrow=False,
+                          font={'color': colors_temp['text']})],
+        margin=dict(t=40, b=40, l=40, r=40),
+        legend=dict(yanchor="top", y=0.99, xanchor="center", x=0.01),
+        font={'color': colors_temp['text']}
+    )
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Mass, unique, interval
+# ---------------------------------------------------------------------
+def make_fig_mass_unique_interval(calc, colors_temp):
+    fig = px.bar(x=["Mass Segment", "Unique", "Interval"],
+                 y=[calc['number_masssegment_completed'], calc['number_unique_completed'],
+                    calc['number_interval_completed']], text_auto='.2s',
+                 title='Общее количество <BR> исполненых по категориям',
+                 color_discrete_sequence=px.colors.sequential.Blugrn)
+    fig.update_yaxes(title='Исполнено', visible=True, showticklabels=False)
+    fig.update_xaxes(title='Категории', visible=True, showticklabels=True)
+    fig.update_layout(margin=dict(t=50, b=0, l=20, r=20),
+                      font={'color': colors_temp['text']})
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Top of branches
+# ---------------------------------------------------------------------
+def make_fig_top_filials(calc, colors_temp):
+    fig = px.bar(calc['df_top_filials'], x="Филиал исполнитель ДМОД", y="Выполнено", text_auto='.2s',
+                 height=400, width=400, color_discrete_map={'Исполнено': '#464646'})
+    fig.update_layout(title='Филиалы лидеры (кол-во исполненных)',
+                      font={'color': colors_temp['text']})
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Total number of completed monitoring cases
+# ---------------------------------------------------------------------
+def make_fig_plan_compl_year(calc, colors_temp):
+    df_plan_year, df_compl_year = calc['df_plan_year'], calc['df_compl_year']
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=df_plan_year["Месяц"], y=df_plan_year["Количество"], name='План',
+                         text=df_plan_year["Количество"]))
+    fig.add_trace(go.Bar(x=df_compl_year["Месяц"], y=df_compl_year["Количество"], name="Исполнено",
+                         text=df_compl_year["Количество"]))
+    fig.update_traces(textfont_size=12, textangle=0, textposition="outside",
+                      cliponaxis=False)
+    fig.update_layout(barmode='group', xaxis_tickangle=-45, height=500, width=700,
+                      title='План мониторинга на год',
+                      font={'color': colors_temp['text']})
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Completed monitoring cases by branches
+# ---------------------------------------------------------------------
+def make_fig_plan_completed(calc, colors_temp):
+    df_plan_completed = calc['df_plan_completed']
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=df_plan_completed["Филиал исполнитель ДМОД"], y=df_plan_completed["План"],
+                         name="План"))
+    fig.add_trace(
+        go.Bar(x=df_plan_completed["Филиал исполнитель ДМОД"], y=df_plan_completed["Выполнено"],
+               name="Исполнено", text=df_plan_completed["Выполнено"]))
+    fig.update_traces(textfont_size=12, textangle=0, textposition='outside', cliponaxis=False)
+    fig.update_layout(barmode='overlay', xaxis_tickangle=-45, height=500, width=700,
+                      title='Исполнено объектов к плану по всему году',
+                      font={'color': colors_temp['text']})
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Completed monitoring cases by months, year over year
+# ---------------------------------------------------------------------
+def make_fig_year_over_year(df_years, colors_temp):
+    fig = go.Figure()
+    for year, df_year in df_years.groupby('Год', sort=True):
+        fig.add_trace(go.Bar(x=df_year["Месяц"], y=df_year["Количество"], name=year, text=df_year["Количество"]))
+    fig.update_traces(textfont_size=12, textangle=0, textposition="outside", cliponaxis=False)
+    fig.update_layout(barmode='group', xaxis_tickangle=-45, height=500, width=700,
+                      title='Исполнено по месяцам, год к году',
+                      font={'color': colors_temp['text']})
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Completed cases by branch
+# ---------------------------------------------------------------------
+@timed_stage
+def make_fig_plan_completed_branch(df_plan_year_branch, df_compl_year_branch, colors_temp):
+    fig = go.Figure()
+    fig.add_trace(
+        go.Bar(x=df_plan_year_branch["Месяц"], y=df_plan_year_branch["Количество"], name='План',
+               text=df_plan_year_branch["Количество"]))
+    fig.add_trace(
+        go.Bar(x=df_compl_year_branch["Месяц"], y=df_compl_year_branch["Количество"], name="Исполнено",
+               text=df_compl_year_branch["Количество"]))
+    fig.update_traces(textfont_size=12, textangle=0, textposition="outside",
+                      cliponaxis=False)
+    fig.update_layout(barmode='group', xaxis_tickangle=-45, height=500, width=700,
+                      title='План мониторинга на год по выбранному филиалу',
+                      font={'color': colors_temp['text']})
+    return fig
+
+
+# ---------------------------------------------------------------------
+#   Prepare graphs, bars and figures
+# ---------------------------------------------------------------------
+@timed_stage
+def prepare_fig(calc, colors_temp):
+    #   Figures of the header, the figures of the tabs are made with their parts
+    return {'fig_main_plan_completed': make_fig_main_plan_completed(calc, colors_temp),
+            'fig_mass_unique_interval': make_fig_mass_unique_interval(calc, colors_temp)}
+
+
+colors = {
+    'background': '#c4e6c5',
+    'tabletext': '#2d124d',
+    'text': '#2d124d'
+}
+
+
+# ---------------------------------------------------------------------
+#   Dashboard snapshot: all results for every main filter, built in background
+# ---------------------------------------------------------------------
+SNAPSHOT_REFRESH_SECONDS = 300  # how often the source files are checked for changes
+SNAPSHOT_POLL_INTERVAL = 10  # seconds, how often the browser asks for a new snapshot version
+
+current_snapshot = None
+snapshot_build_lock = threading.Lock()
+snapshot_start_lock = threading.Lock()
+snapshot_refresh_event = threading.Event()
+snapshot_refresher = None
+
+
+def source_signature():
+    #   The date is a part of the signature: expired cases depend on the current month
+    return (date.today(),) + tuple(tuple(stat) for stat in sources_stat())
+
+
+def make_views(df_main_jornal, date_rep=None, cube_state=None):
+    #   All main filters are calculated in one pass
+    views = make_calc(df_main_jornal, date_rep, cube_state)
+    for filter_temp, calc in views.items():
+        calc['figures'] = MappingProxyType(prepare_fig(calc, colors))
+        views[filter_temp] = MappingProxyType(calc)
+    return MappingProxyType(views)
+
+
+# ---------------------------------------------------------------------
+#   Snapshot shared by the server processes (production server with several workers):
+#   one process builds it and writes cache/snapshot.pickle, the others read the file
+# ---------------------------------------------------------------------
+SNAPSHOT_SHARED = False  # set by run_production()
+SNAPSHOT_CACHE_FILE = os.path.join(JORNAL_CACHE_DIR, 'snapshot.pickle')
+SNAPSHOT_CACHE_META = os.path.join(JORNAL_CACHE_DIR, 'snapshot.json')
+SNAPSHOT_CACHE_LOCK = os.path.join(JORNAL_CACHE_DIR, 'snapshot.lock')
+
+#   Time of change of SNAPSHOT_CACHE_META when it was checked last
+snapshot_meta_mtime = None
+
+
+@contextlib.contextmanager
+def shared_lock():
+    #   Only one process builds the snapshot or writes the history at a time
+    if not SNAPSHOT_SHARED or fcntl is None:
+        yield
+        return
+    os.makedirs(JORNAL_CACHE_DIR, exist_ok=True)
+    with open(SNAPSHOT_CACHE_LOCK, mode='a') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def read_snapshot_meta():
+    try:
+        with open(SNAPSHOT_CACHE_META, mode='r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(e)
+        print("Can't read '" + SNAPSHOT_CACHE_META + "'")
+        return None
+
+
+def read_snapshot_cache(meta):
+    try:
+        time_start = time.perf_counter()
+        with open(SNAPSHOT_CACHE_FILE, mode='rb') as file:
+            state = pickle.load(file)
+        if state['version'] != meta['version'] or 'year' not in state:
+            #   Another version, or a snapshot of an older dashboard
+            return None
+        views = {filter_temp: MappingProxyType(dict(calc, figures=MappingProxyType(calc['figures'])))
+                 for filter_temp, calc in state['views'].items()}
+        print("Snapshot " + str(state['version']) + " read from " + SNAPSHOT_CACHE_FILE + " in "
+              + format(time.perf_counter() - time_start, '.2f') + " s")
+        return MappingProxyType(dict(state, views=MappingProxyType(views)))
+    except Exception as e:
+        print(e)
+        print("Can't read the snapshot '" + SNAPSHOT_CACHE_FILE + "', it will be built here")
+        return None
+
+
+def write_snapshot_cache(snapshot):
+    try:
+        os.makedirs(JORNAL_CACHE_DIR, exist_ok=True)
+
+        #   The old version goes first, so a half-written snapshot is never taken
+        if os.path.exists(SNAPSHOT_CACHE_META):
+            os.remove(SNAPSHOT_CACHE_META)
+        state = dict(snapshot, views={filter_temp: dict(calc, figures=dict(calc['figures']))
+                                      for filter_temp, calc in snapshot['views'].items()})
+        with open(SNAPSHOT_CACHE_FILE + '.tmp', mode='wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(SNAPSHOT_CACHE_FILE + '.tmp', SNAPSHOT_CACHE_FILE)
+        with open(SNAPSHOT_CACHE_META, mode='w', encoding='utf-8') as file:
+            json.dump({'version': snapshot['version'], 'built_at': snapshot['built_at'].isoformat()}, file)
+    except Exception as e:
+        print(e)
+        print("Can't write the snapshot '" + SNAPSHOT_CACHE_FILE + "'")
+
+
+def load_shared_snapshot():
+    #   Takes a newer snapshot of another process (snapshot_build_lock is held), returns its version
+    global current_snapshot
+
+    meta = read_snapshot_meta()
+    if meta is None:
+        return 0
+    if current_snapshot is None or meta['version'] > current_snapshot['version']:
+        snapshot = read_snapshot_cache(meta)
+        if snapshot is not None:
+            current_snapshot = snapshot
+    return meta['version']
+
+
+def sync_snapshot():
+    #   Checked by the timer of the browser: only the time of change of a small file, unless it was changed
+    global snapshot_meta_mtime
+
+    if not SNAPSHOT_SHARED:
+        return
+    try:
+        mtime = os.stat(SNAPSHOT_CACHE_META).st_mtime_ns
+    except OSError:
+        return
+    if mtime == snapshot_meta_mtime or not snapshot_build_lock.acquire(blocking=False):
+        return
+    try:
+        load_shared_snapshot()
+        snapshot_meta_mtime = mtime
+    finally:
+        snapshot_build_lock.release()
+
+
+def build_snapshot(version, signature):
+    df_main_jornal = load_main_jornal()
+
+    #   Write to file (work-spreadsheet) in background, if the data were changed
+    export_csv(df_main_jornal)
+
+    #   The cube of the last snapshot is updated by the changed rows only
+    previous = current_snapshot
+    cube_state = update_cube(previous['cube'] if previous is not None else None, df_main_jornal)
+    snapshot = MappingProxyType({'version': version, 'signature': signature, 'built_at': datetime.now(),
+                                 'year': REPORT_YEAR, 'views': make_views(df_main_jornal, cube_state=cube_state),
+                                 'cube': cube_state, 'parts': {}})
+
+    #   The parts of the tabs which were opened are made at once, the others wait for their tab
+    if previous is not None:
+        for part in PART_CALCS:
+            if part in previous['parts']:
+                make_part(snapshot['views'], snapshot['parts'], part)
+    return snapshot
+
+
+def refresh_snapshot(force=False):
+    global current_snapshot
+
+    with snapshot_build_lock, shared_lock():
+        update_report_year()
+        signature = source_signature()
+        shared_version = load_shared_snapshot() if SNAPSHOT_SHARED else 0
+        if not force and current_snapshot is not None and current_snapshot['signature'] == signature:
+            return current_snapshot
+
+        version = max(0 if current_snapshot is None else current_snapshot['version'], shared_version) + 1
+        time_start = time.perf_counter()
+        snapshot = build_snapshot(version, signature)
+
+        #   One assignment: requests see either the old or the new snapshot, never a mix
+        current_snapshot = snapshot
+        print("Snapshot " + str(version) + " built in " + format(time.perf_counter() - time_start, '.2f') + " s")
+        if SNAPSHOT_SHARED:
+            write_snapshot_cache(snapshot)
+        return snapshot
+
+
+def snapshot_refresher_loop():
+    while True:
+        #   New or changed rows of all years go to the history
+        with shared_lock():
+            update_history()
+
+        #   Wake up on timeout (rebuild only if files changed) or on "Обновить" (always rebuild)
+        force = snapshot_refresh_event.wait(SNAPSHOT_REFRESH_SECONDS)
+        snapshot_refresh_event.clear()
+        try:
+            refresh_snapshot(force)
+        except Exception as e:
+            print(e)
+            print("Can't build a new snapshot, the previous one is still used")
+
+
+def start_snapshot_refresher():
+    global snapshot_refresher
+
+    with snapshot_start_lock:
+        if snapshot_refresher is None:
+            snapshot_refresher = threading.Thread(target=snapshot_refresher_loop, name='snapshot-refresher',
+                                                  daemon=True)
+            snapshot_refresher.start()
+
+
+def request_refresh():
+    snapshot_refresh_event.set()
+
+
+def get_snapshot():
+    snapshot = current_snapshot
+    if snapshot is None:
+        #   The very first request waits for the data, all the next ones don't
+        snapshot = refresh_snapshot()
+    if snapshot_refresher is None:
+        start_snapshot_refresher()
+    return snapshot
+
+
+def get_view(snapshot, main_filter):
+    return snapshot['views'].get(main_filter, snapshot['views']['all'])
+
+
+def get_tab_view(snapshot, tab, main_filter):
+    #   The view with the parts of the tab
+    calc = dict(get_view(snapshot, main_filter))
+    for part in TAB_PARTS[tab]:
+        results = make_part(snapshot['views'], snapshot['parts'], part)
+        calc.update(results.get(main_filter, results['all']))
+    return calc
+
+
+# ---------------------------------------------------------------------
+#   History of all years: main dataframes in cache/history.sqlite
+#   The files of a year are read once, on refresh only new or changed rows are written
+# ---------------------------------------------------------------------
+HISTORY_DB = os.path.join(JORNAL_CACHE_DIR, 'history.sqlite')
+
+#   year -> signature of the stored files, read from the database on first use
+history_index = None
+#   year -> snapshot-like results of an earlier year, made on first use
+history_snapshots = {}
+history_lock = threading.Lock()
+
+
+def history_connect():
+    os.makedirs(JORNAL_CACHE_DIR, exist_ok=True)
+    connection = sqlite3.connect(HISTORY_DB)
+    connection.execute('CREATE TABLE IF NOT EXISTS history_sources (year INTEGER PRIMARY KEY, signature TEXT, '
+                       'version INTEGER, dtypes TEXT, rows INTEGER, updated TEXT)')
+
+    #   Columns or their types were changed: all years are written again
+    if connection.execute('SELECT COUNT(*) FROM history_sources WHERE version != ?',
+                          (JORNAL_CACHE_VERSION,)).fetchone()[0]:
+        connection.execute('DROP TABLE IF EXISTS history_rows')
+        connection.execute('DELETE FROM history_sources')
+        connection.commit()
+        print("History '" + HISTORY_DB + "' is made again: the columns were changed")
+    return connection
+
+
+def to_history_rows(df_temp, year):
+    #   Key of a row: hash of its values and the number of the same rows before it
+    hashes = pd.util.hash_pandas_object(df_temp, index=False)
+    keys = hashes.map('{:016x}'.format) + '-' + hashes.groupby(hashes).cumcount().astype(str)
+
+    #   SQLite has no categories, dates and durations: text and microseconds are stored
+    df_rows = df_temp.astype({column: object for column in df_temp.columns
+                              if isinstance(df_temp[column].dtype, pd.CategoricalDtype)})
+    for column in DATE_COLUMNS:
+        df_rows[column] = (df_temp[column] - pd.Timestamp(0)) // pd.Timedelta(microseconds=1)
+    for column in DURATION_COLUMNS:
+        df_rows[column] = df_temp[column] // pd.Timedelta(microseconds=1)
+    df_rows.insert(0, 'Строка', np.arange(len(df_rows)))
+    df_rows.insert(0, 'Ключ', keys.to_numpy())
+    df_rows.insert(0, 'Год', year)
+    return df_rows
+
+
+def from_history_rows(df_rows, dtypes):
+    df_temp = df_rows.drop(columns=['Год', 'Ключ', 'Строка'])
+    for column, dtype in dtypes.items():
+        #   Empty cells of dates and durations are NULL
+        if column in DATE_COLUMNS:
+            microseconds = pd.to_numeric(df_temp[column])
+            df_temp[column] = pd.to_datetime(microseconds.fillna(0), unit='us').astype(dtype).where(
+                microseconds.notna())
+        elif column in DURATION_COLUMNS:
+            microseconds = pd.to_numeric(df_temp[column])
+            df_temp[column] = pd.to_timedelta(microseconds.fillna(0), unit='us').astype(dtype).where(
+                microseconds.notna())
+        elif dtype == 'object':
+            #   Empty cells are NaN, as after loading of the workbooks
+            df_temp[column] = df_temp[column].where(df_temp[column].notna(), np.nan)
+        else:
+            df_temp[column] = df_temp[column].astype(dtype)
+    return df_temp
+
+
+def store_history_year(connection, year, df_temp, signature):
+    df_rows = to_history_rows(df_temp, year)
+    stored = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'history_rows'")
+    old_keys = set()
+    if stored.fetchone() is not None:
+        old_keys = {key for (key,) in connection.execute('SELECT "Ключ" FROM history_rows WHERE "Год" = ?', (year,))}
+
+    #   Only the difference is written: a changed row is removed and added again
+    new_rows = df_rows[~df_rows['Ключ'].isin(old_keys)]
+    removed_keys = old_keys.difference(df_rows['Ключ'])
+    if removed_keys:
+        connection.executemany('DELETE FROM history_rows WHERE "Год" = ? AND "Ключ" = ?',
+                               [(year, key) for key in removed_keys])
+    new_rows.to_sql('history_rows', connection, if_exists='append', index=False, chunksize=10000)
+    connection.execute('CREATE INDEX IF NOT EXISTS history_rows_key ON history_rows ("Год", "Ключ")')
+
+    dtypes = {column: str(dtype) for column, dtype in df_temp.dtypes.items()}
+    connection.execute('INSERT OR REPLACE INTO history_sources VALUES (?, ?, ?, ?, ?, ?)',
+                       (year, signature, JORNAL_CACHE_VERSION, json.dumps(dtypes, ensure_ascii=False), len(df_rows),
+                        datetime.now().isoformat(timespec='seconds')))
+    connection.commit()
+    print("History " + str(year) + ": " + str(len(new_rows)) + " rows added, " + str(len(removed_keys))
+          + " rows removed")
+
+
+def update_history():
+    global history_index
+
+    snapshot = current_snapshot
+    try:
+        with history_lock:
+            connection = history_connect()
+            try:
+                stored = dict(connection.execute('SELECT year, signature FROM history_sources'))
+
+                #   Earlier years: the workbooks are read only if they are new or were changed
+                for year in range(FIRST_YEAR, REPORT_YEAR):
+                    filenames = source_files(year)
+                    if not all(os.path.exists(filename) for filename in filenames):
+                        continue
+                    signature = json.dumps(sources_stat(filenames), ensure_ascii=False)
+                    if stored.get(year) != signature:
+                        #   Not kept in the source cache: the file of an earlier year is read once
+                        df_temp = merge_jornal(*load_sources([(filenames[0], load_new_jornal),
+                                                              (filenames[1], load_mon)], use_cache=False))
+                        store_history_year(connection, year, df_temp, signature)
+
+                #   The year of the snapshot: its dataframe
+                if snapshot is not None:
+                    signature = json.dumps(snapshot['signature'][1:], ensure_ascii=False)
+                    if stored.get(snapshot['year']) != signature:
+                        store_history_year(connection, snapshot['year'],
+                                           snapshot['views']['all']['df_main_jornal'], signature)
+
+                history_index = dict(connection.execute('SELECT year, signature FROM history_sources'))
+            finally:
+                connection.close()
+    except Exception as e:
+        print(e)
+        print("Can't update the history '" + HISTORY_DB + "'")
+
+
+def history_years():
+    global history_index
+
+    if history_index is None:
+        try:
+            with history_lock:
+                connection = history_connect()
+                try:
+                    history_index = dict(connection.execute('SELECT year, signature FROM history_sources'))
+                finally:
+                    connection.close()
+        except Exception as e:
+            print(e)
+            print("Can't read the history '" + HISTORY_DB + "'")
+            history_index = {}
+    return sorted(set(history_index) | {REPORT_YEAR})
+
+
+@timed_stage
+def load_history_year(year):
+    with history_lock:
+        connection = history_connect()
+        try:
+            dtypes = connection.execute('SELECT dtypes FROM history_sources WHERE year = ?', (year,)).fetchone()
+            if dtypes is None:
+                return None
+            df_rows = pd.read_sql_query('SELECT * FROM history_rows WHERE "Год" = ? ORDER BY "Строка"', connection,
+                                        params=(year,))
+        finally:
+            connection.close()
+    return from_history_rows(df_rows, json.loads(dtypes[0]))
+
+
+def get_year_snapshot(year):
+    #   The report year is the current snapshot, an earlier year is calculated from the history on first use
+    snapshot = get_snapshot()
+    if not year or int(year) == snapshot['year']:
+        return snapshot
+    year = int(year)
+    if year not in history_years():
+        return snapshot
+
+    signature = history_index[year]
+    cached = history_snapshots.get(year)
+    if cached is not None and cached['version'] == (year, signature):
+        return cached
+
+    df_main_jornal = load_history_year(year)
+    if df_main_jornal is None:
+        return snapshot
+    cached = MappingProxyType({'version': (year, signature), 'signature': signature, 'built_at': datetime.now(),
+                               'views': make_views(df_main_jornal, date(year, 12, 31)), 'parts': {}})
+    history_snapshots[year] = cached
+    return cached
+
+
+# ---------------------------------------------------------------------
+#   Completed cases by months of every year, for one main filter
+# ---------------------------------------------------------------------
+def year_over_year(main_filter):
+    frames = []
+    for year in history_years():
+        calc = get_view(get_year_snapshot(year), main_filter)
+        frames.append(calc['df_compl_year'].assign(**{'Год': str(year)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+# ---------------------------------------------------------------------
+#   List of expired cases: filtering, sorting and pages on the server
+# ---------------------------------------------------------------------
+EXPIRED_PAGE_SIZE = 50
+EXPIRED_CACHE_SIZE = 64
+
+#   (version or (year, signature), main filter, sorting, filter query) -> rows of the list, filtered and sorted
+expired_cache = {}
+expired_cache_lock = threading.Lock()
+
+FILTER_OPERATORS = [['ge ', '>='], ['le ', '<='], ['lt ', '<'], ['gt ', '>'], ['ne ', '!='], ['eq ', '='],
+                    ['contains '], ['datestartswith ']]
+
+
+def split_filter_part(filter_part):
+    #   "{column} operator value" -> (column, operator, value)
+    for operator_type in FILTER_OPERATORS:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+
+                value_part = value_part.strip()
+                v0 = value_part[0] if value_part else ''
+                if v0 and v0 == value_part[-1] and v0 in ("'", '"', '`'):
+                    value = value_part[1: -1].replace('\\' + v0, v0)
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+
+                #   Word operators need spaces after them in the filter string, but we don't want these later
+                return name, operator_type[0].strip(), value
+    return None, None, None
+
+
+def filter_expired(df_temp, filter_query):
+    mask = pd.Series(True, index=df_temp.index)
+    for filter_part in filter_query.split(' && '):
+        column, operator, value = split_filter_part(filter_part)
+        if column not in df_temp.columns:
+            continue
+        series = df_temp[column]
+        if operator in ('contains', 'datestartswith'):
+            text = series.astype(str)
+            if operator == 'contains':
+                mask &= text.str.contains(str(value), case=False, regex=False)
+            else:
+                mask &= text.str.startswith(str(value))
+        else:
+            #   Text columns are compared as text, the numbers as numbers
+            if not pd.api.types.is_numeric_dtype(series):
+                series = series.astype(str)
+                value = str(value)
+            elif isinstance(value, str):
+                continue
+            if operator == 'eq':
+                mask &= series == value
+            elif operator == 'ne':
+                mask &= series != value
+            elif operator == 'lt':
+                mask &= series < value
+            elif operator == 'le':
+                mask &= series <= value
+            elif operator == 'gt':
+                mask &= series > value
+            elif operator == 'ge':
+                mask &= series >= value
+    return df_temp[mask]
+
+
+@timed_stage
+def query_expired(snapshot, main_filter, sort_by, filter_query):
+    sorting = tuple((column['column_id'], column['direction']) for column in sort_by or [])
+    key = (snapshot['version'], main_filter, sorting, filter_query or '')
+    with expired_cache_lock:
+        cached = expired_cache.get(key)
+    if cached is not None:
+        return cached
+
+    #   Categories are compared and sorted as text, like the table in the browser did
+    df_expired = get_tab_view(snapshot, 'expired_tab', main_filter)['list_expired_branch']
+    df_expired = df_expired.astype({column: object for column in df_expired.columns
+                                    if isinstance(df_expired[column].dtype, pd.CategoricalDtype)})
+    if filter_query:
+        df_expired = filter_expired(df_expired, filter_query)
+    if sorting:
+        df_expired = df_expired.sort_values([column for column, _ in sorting],
+                                            ascending=[direction == 'asc' for _, direction in sorting],
+                                            kind='stable', na_position='last')
+
+    with expired_cache_lock:
+        #   Results of the older snapshots are not needed any more (the years of the history are kept)
+        for old_key in [old_key for old_key in expired_cache
+                        if isinstance(old_key[0], int) and old_key[0] < current_snapshot['version']]:
+            del expired_cache[old_key]
+        if len(expired_cache) >= EXPIRED_CACHE_SIZE:
+            expired_cache.clear()
+        expired_cache[key] = df_expired
+    return df_expired
+
+
+# ---------------------------------------------------------------------
+#   Results of callbacks: the same filters of the same data give the same result.
+#   The least recently used results are dropped, a result is kept CALLBACK_CACHE_SECONDS at most.
+#   With several server processes the results are also kept in cache/callbacks, one file per result,
+#   so a result made by one worker is taken by the others
+# ---------------------------------------------------------------------
+CALLBACK_CACHE_SIZE = 256
+CALLBACK_CACHE_SECONDS = 600
+CALLBACK_CACHE_DIR = None  # set by run_production(), None: the results are kept by the process only
+
+#   (callback, data version, inputs as JSON) -> (time of calculation, outputs)
+callback_cache = collections.OrderedDict()
+callback_cache_stats = {'hits': 0, 'misses': 0, 'shared_hits': 0}
+callback_cache_lock = threading.Lock()
+
+
+def data_version():
+    #   Version of the report year and signatures of the years in the history
+    version = get_snapshot()['version']
+    history_years()
+    return (version,) + tuple(sorted((history_index or {}).items()))
+
+
+def callback_cache_file(key):
+    return os.path.join(CALLBACK_CACHE_DIR, hashlib.sha1(repr(key).encode()).hexdigest() + '.pickle')
+
+
+def read_shared_result(key):
+    #   (time of calculation, outputs) made by any worker, or None
+    try:
+        with open(callback_cache_file(key), mode='rb') as file:
+            stored_key, cached = pickle.load(file)
+        return cached if stored_key == key else None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(e)
+        print("Can't read a result of a callback in '" + CALLBACK_CACHE_DIR + "'")
+        return None
+
+
+def write_shared_result(key, cached):
+    try:
+        os.makedirs(CALLBACK_CACHE_DIR, exist_ok=True)
+        filename = callback_cache_file(key)
+        #   Another worker or thread may write the same result at the same time
+        filename_temp = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+        with open(filename_temp, mode='wb') as file:
+            pickle.dump((key, cached), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filename_temp, filename)
+
+        #   The oldest results go when there are too many of them
+        files = [os.path.join(CALLBACK_CACHE_DIR, name) for name in os.listdir(CALLBACK_CACHE_DIR)
+                 if name.endswith('.pickle')]
+        if len(files) > CALLBACK_CACHE_SIZE:
+            files.sort(key=lambda name: os.stat(name).st_mtime)
+            for name in files[:len(files) - CALLBACK_CACHE_SIZE]:
+                os.remove(name)
+    except OSError as e:
+        print(e)
+        print("Can't write a result of a callback to '" + CALLBACK_CACHE_DIR + "'")
+
+
+def memoize_callback(func):
+    @functools.wraps(func)
+    def wrapper(*args):
+        key = (func.__name__, data_version(), json.dumps(args, sort_keys=True, default=str))
+        #   Wall clock: the time of a result is compared by other processes
+        now = time.time()
+        with callback_cache_lock:
+            cached = callback_cache.get(key)
+            if cached is not None and now - cached[0] < CALLBACK_CACHE_SECONDS:
+                callback_cache.move_to_end(key)
+                callback_cache_stats['hits'] += 1
+                return cached[1]
+
+        cached = read_shared_result(key) if CALLBACK_CACHE_DIR else None
+        if cached is not None and now - cached[0] < CALLBACK_CACHE_SECONDS:
+            with callback_cache_lock:
+                callback_cache_stats['shared_hits'] += 1
+            result = cached[1]
+        else:
+            #   PreventUpdate of an inactive tab is not kept
+            cached = (now, func(*args))
+            result = cached[1]
+            with callback_cache_lock:
+                callback_cache_stats['misses'] += 1
+            if CALLBACK_CACHE_DIR:
+                write_shared_result(key, cached)
+
+        with callback_cache_lock:
+            callback_cache[key] = cached
+            callback_cache.move_to_end(key)
+            while len(callback_cache) > CALLBACK_CACHE_SIZE:
+                callback_cache.popitem(last=False)
+        return result
+    return wrapper
+
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.ZEPHYR])
+
+#   Tabs with data: each has a store in the layout which asks the server for the content of the tab,
+#   and a store with the key of the content the server has sent
+DATA_TABS = ['year_plan_tab', 'top_tab', 'average_time_tab', 'completed_tab', 'expired_tab']
+#   Figures of the tabs which are updated by their data only
+TAB_GRAPHS = {'year_plan_tab': ['graph-plan_compl_year'], 'top_tab': ['graph-top_filials'],
+              'completed_tab': ['graph-plan-completed', 'graph-plan-completed-branch']}
+app.title = "Мониторинг"
+
+#   Title of dashboard
+header = html.H2(id='output-container-title', style={'textAlign': 'center'})
+
+# ---------------------------------------------------------------------
+#   Layout is made on every page load
+# ---------------------------------------------------------------------
+def serve_layout():
+    #   No data in the layout: the callbacks fill the panels from the snapshot on page load
+    version = current_snapshot['version'] if current_snapshot is not None else None
+
+    return dbc.Container([
+        html.Div(style={
+            'background-image': 'url("/assets/background2.jpg")',
+        }, children=[
+            header,
+            dcc.Store(id='snapshot-version', data=version),
+            dcc.Interval(id='snapshot-poll', interval=SNAPSHOT_POLL_INTERVAL * 1000),
+            *[dcc.Store(id=tab + '-request') for tab in DATA_TABS],
+            *[dcc.Store(id=tab + '-loaded') for tab in DATA_TABS],
+            dbc.Row([
+                #   First column (width 2)
+                dbc.Col([
+                    dbc.Card([
+                        dcc.Graph(
+                            id='graph-main_plan_completed',
                         ),
-                        dbc.Col(
-                            dbc.Card([
-                                dbc.CardHeader("Исполнено"),
-                                dbc.CardBody(
-                                    [
-                                        dbc.Row([
-                                            dbc.Col([
-                                                html.H1(html.B(id='card_completed')),
-                                            ]),
-                                            dbc.Col([
-                                                dash_table.DataTable(style_data={'whiteSpace': 'normal',
-                                                                                 'height': 'auto',
-                                                                                 # 'border': 'none'
-                                                                                 },
-                                                                     id='output-data-table-comleted',
-                                                                     data=top_completed_branch.to_dict('records'),
-                                                                     style_header={'fontWeight': 'bold'},
-                                                                     style_cell={'textAlign': 'center',
-                                                                                 'backgroundColor': 'transparent',
-                                                                                 'color': colors['tabletext'],
-                                                                                 'font_size': '12px',
-                                                                                 'whiteSpace': 'normal',
-                                                                                 'height': 'auto'},
-                                                                     columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                               'name': ['Филиал']},
-                                                                              {'id': 'Выполнено',
-                                                                               'name': ['Исполнено']}],
-                                                                     ),
-                                            ])
-                                        ])
-                                    ]
-                                ),
-                            ], color="info", outline=False, inverse=True),
-                            width=3,
+                        dbc.Label("Фильтр:", style={'color': colors['text'], 'margin-left': '15px'}),
+                        dcc.Dropdown([
+                            {'label': 'Вместе г.Алматы + филиальная сеть', 'value': 'all'},
+                            {'label': 'Филиальная сеть', 'value': 'branch'},
+                            {'label': 'г. Алматы', 'value': 'almaty'}
+                        ],
+                            'all', id='filter-dropdown',
+                            clearable=False, style={'color': "#111111", 'verticalAlign': 'bottom',
+                                                    'margin-left': '5px', 'margin-right': '15px'}),
+                        dbc.Label("Год:", style={'color': colors['text'], 'margin-left': '15px'}),
+                        dcc.Dropdown([REPORT_YEAR], REPORT_YEAR, id='year-dropdown',
+                                     clearable=False, style={'color': "#111111", 'verticalAlign': 'bottom',
+                                                             'margin-left': '5px', 'margin-right': '15px'}),
+                        html.Br(),
+                        html.Button(id='submit-button-state', n_clicks=0, children='Обновить',
+                                    type="button",
+                                    style={'font-size': '12px', 'width': '140px', 'height': '35px',
+                                           'display': 'inline-block',
+                                           'margin-left': '10px'
+                                           }
+                                    ),
+                        dcc.Graph(
+                            id='graph-mass_unique_interval',
                         ),
-                        dbc.Col(
-                            dbc.Card([
-                                dbc.CardHeader("Осталось"),
-                                dbc.CardBody(
-                                    [
-                                        dbc.Row([
-                                            dbc.Col([
-                                                html.H1(html.B(id='card_left')),
-                                            ]),
-                                            dbc.Col([
-                                                dash_table.DataTable(style_data={'whiteSpace': 'normal',
-                                                                                 'height': 'auto',
-                                                                                 },
-                                                                     id='output-data-table-remined',
-                                                                     data=top_remained_branch.to_dict('records'),
-                                                                     style_header={'fontWeight': 'bold'},
-                                                                     style_cell={'textAlign': 'center',
-                                                                                 'backgroundColor': 'transparent',
-                                                                                 'color': colors['tabletext'],
-                                                                                 'font_size': '12px',
-                                                                                 'whiteSpace': 'normal',
-                                                                                 'height': 'auto'},
-                                                                     columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                               'name': ['Филиал']},
-                                                                              {'id': 'Осталось',
-                                                                               'name': ['Осталось']}],
-                                                                     ),
+                        html.Br(),
+                        html.Img(src='/assets/logo.jpg'),
+                    ], color="success", outline=True),
+                ], width=2),
+                #   Second column (width 10)
+                dbc.Col([
+                    dbc.Card([
+                        dbc.Row([
+                            dbc.Col(
+                                dbc.Card([
+                                    dbc.CardHeader("План"),
+                                    dbc.CardBody(
+                                        [
+                                            dbc.Row([
+                                                dbc.Col([
+                                                    html.H1(html.B(id='card_plan')),
+                                                ]),
+                                                dbc.Col([
+                                                    dash_table.DataTable(style_data={'whiteSpace': 'normal',
+                                                                                     'height': 'auto',
+                                                                                     # 'border': 'none'
+                                                                                     },
+                                                                         id='output-data-table-plan',
+                                                                         style_header={'fontWeight': 'bold'},
+                                                                         style_cell={'textAlign': 'center',
+                                                                                     'backgroundColor': 'transparent',
+                                                                                     'color': colors['tabletext'],
+                                                                                     'font_size': '12px',
+                                                                                     'whiteSpace': 'normal',
+                                                                                     'height': 'auto'},
+                                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                                   'name': ['Филиал']},
+                                                                                  {'id': 'План', 'name': ['План']}],
+                                                                         ),
+                                                ])
                                             ])
-                                        ]),
-                                    ]
-                                ),
-                            ], color="warning", outline=False, inverse=True),
-                            width=3,
-                        ),
-                        dbc.Col(
-                            dbc.Card([
-                                dbc.CardHeader("Просрочено"),
-                                dbc.CardBody(
-                                    [
-                                        dbc.Row([
-                                            dbc.Col([
-                                                html.H1(html.B(id="card_expired")),
-                                            ]),
-                                            dbc.Col([
-                                                dash_table.DataTable(style_data={'whiteSpace': 'normal',
-                                                                                 'height': 'auto',
-                                                                                 },
-                                                                     id='output-data-table-expired',
-                                                                     data=top_expired_branch.to_dict('records'),
-                                                                     style_header={'fontWeight': 'bold'},
-                                                                     style_cell={'textAlign': 'center',
-                                                                                 'backgroundColor': 'transparent',
-                                                                                 'color': colors['tabletext'],
-                                                                                 'font_size': '12px',
-                                                                                 'whiteSpace': 'normal',
-                                                                                 'height': 'auto'},
-                                                                     columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                               'name': ['Филиал']},
-                                                                              {'id': 'Просрочено',
-                                                                               'name': ['Просрочено']}],
-                                                                     ),
-                                                dbc.NavLink("Подробнее", id="expired_nav_link", n_clicks=0),
+                                        ]
+                                    ),
+                                ], color="success", outline=False, inverse=True),
+                                width=3,
+                            ),
+                            dbc.Col(
+                                dbc.Card([
+                                    dbc.CardHeader("Исполнено"),
+                                    dbc.CardBody(
+                                        [
+                                            dbc.Row([
+                                                dbc.Col([
+                                                    html.H1(html.B(id='card_completed')),
+                                                ]),
+                                                dbc.Col([
+                                                    dash_table.DataTable(style_data={'whiteSpace': 'normal',
+                                                                                     'height': 'auto',
+                                                                                     # 'border': 'none'
+                                                                                     },
+                                                                         id='output-data-table-comleted',
+                                                                         style_header={'fontWeight': 'bold'},
+                                                                         style_cell={'textAlign': 'center',
+                                                                                     'backgroundColor': 'transparent',
+                                                                                     'color': colors['tabletext'],
+                                                                                     'font_size': '12px',
+                                                                                     'whiteSpace': 'normal',
+                                                                                     'height': 'auto'},
+                                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                                   'name': ['Филиал']},
+                                                                                  {'id': 'Выполнено',
+                                                                                   'name': ['Исполнено']}],
+                                                                         ),
+                                                ])
                                             ])
-                                        ]),
-                                    ]
-                                ),
-                            ], color="danger", outline=False, inverse=True),
-                            width=3,
-                        ),
-                    ]),
-                ]),
-                html.Br(),
-                dbc.Card([
-                    dbc.Tabs(id='tabs', active_tab='year_plan_tab', children=[
-                        dbc.Tab(children=[
-                            dcc.Graph(
-                                id='graph-plan_compl_year',
-                                figure=fig_plan_compl_year
-                            )
-                        ], label="План на год", tab_id="year_plan_tab"),
-                        dbc.Tab([
-                            dbc.Row([
-                                dbc.Col([
-                                    dcc.Graph(
-                                        id='graph-top_filials',
-                                        figure=fig_top_filials
+                                        ]
                                     ),
-                                ], align="center"),
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='output-data-table-r12',
-                                                         data=df_top_leaders.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[
-                                                             {'id': 'Ф.И.О. исполнителя',
-                                                              'name': ['Лидеры', 'Исполнитель']},
-                                                             {'id': 'Количество', 'name': ['Лидеры', 'Количество']}
-                                                         ]),
-                                ])
-                            ]),
-                        ], label="Лидеры", tab_id="top_tab"),
-                        dbc.Tab(children=[
-                            dbc.Row([
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='output-average-r',
-                                                         data=df_average_filials_r.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                   'name': ['Среднее время подготовки заключения.',
-                                                                            'Филиал исполнитель ДМОД']},
-                                                                  {'id': 'Время затраченное на заключение Исполнителем',
-                                                                   'name': ['Среднее время подготовки заключения.',
-                                                                            'Время затраченное на заключение Исполнителем']}
-                                                                  ])
-                                ]),
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='output-average-unique',
-                                                         data=df_average_filials_unique.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[{'id': 'Уникальность обеспечения_',
-                                                                   'name': [
-                                                                       'Среднее время подготовки заключения по категориям.',
-                                                                       'Категория']},
-                                                                  {'id': 'Филиал исполнитель ДМОД_',
-                                                                   'name': [
-                                                                       'Среднее время подготовки заключения по категориям.',
-                                                                       'Филиал исполнитель ДМОД']},
-                                                                  {
-                                                                      'id': 'Время затраченное на заключение Исполнителем_mean',
-                                                                      'name': [
-                                                                          'Среднее время подготовки заключения по категориям.',
-                                                                          'Время затраченное на заключение Исполнителем']}
-                                                                  ])
-                                ]),
-                            ]),
-                            dbc.Row([
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='output-average-f_apr',
-                                                         data=df_average_f_apr_r.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[{'id': 'Филиал исполнитель ДМОД_',
-                                                                   'name': [
-                                                                       'Среднее время подготовки согласования заключения',
-                                                                       'Филиал исполнитель ДМОД']},
-                                                                  {
-                                                                      'id': 'Время затраченное на согласование куратором_mean',
-                                                                      'name': [
-                                                                          'Среднее время подготовки согласования заключения',
-                                                                          'Время затраченное на согласование куратором']}
-                                                                  ])
-                                ]),
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='output-average-f_apr_unique',
-                                                         data=df_average_f_apr_unique.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[{'id': 'Уникальность обеспечения_',
-                                                                   'name': [
-                                                                       'Среднее время согласования заключения по категориям',
-                                                                       'Уникальность обеспечения']},
-                                                                  {'id': 'Филиал исполнитель ДМОД_',
-                                                                   'name': [
-                                                                       'Среднее время согласования заключения по категориям',
-                                                                       'Филиал исполнитель ДМОД']},
-                                                                  {
-                                                                      'id': 'Время затраченное на согласование куратором_mean',
-                                                                      'name': [
-                                                                          'Среднее время согласования заключения по категориям',
-                                                                          'Время затраченное на согласование куратором']}
-                                                                  ])
-                                ]),
-                            ]),
-                        ], label="Среднее время", tab_id="average_time_tab"),
-                        dbc.Tab(children=[
-                            dbc.Row([
-                                dbc.Col([
-                                    dcc.Graph(
-                                        id='graph-plan-completed',
-                                        figure=fig_plan_completed
+                                ], color="info", outline=False, inverse=True),
+                                width=3,
+                            ),
+                            dbc.Col(
+                                dbc.Card([
+                                    dbc.CardHeader("Осталось"),
+                                    dbc.CardBody(
+                                        [
+                                            dbc.Row([
+                                                dbc.Col([
+                                                    html.H1(html.B(id='card_left')),
+                                                ]),
+                                                dbc.Col([
+                                                    dash_table.DataTable(style_data={'whiteSpace': 'normal',
+                                                                                     'height': 'auto',
+                                                                                     },
+                                                                         id='output-data-table-remined',
+                                                                         style_header={'fontWeight': 'bold'},
+                                                                         style_cell={'textAlign': 'center',
+                                                                                     'backgroundColor': 'transparent',
+                                                                                     'color': colors['tabletext'],
+                                                                                     'font_size': '12px',
+                                                                                     'whiteSpace': 'normal',
+                                                                                     'height': 'auto'},
+                                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                                   'name': ['Филиал']},
+                                                                                  {'id': 'Осталось',
+                                                                                   'name': ['Осталось']}],
+                                                                         ),
+                                                ])
+                                            ]),
+                                        ]
                                     ),
-                                ]),
-                                dbc.Col([
-                                    dcc.Dropdown(df_list_branch, 'all', id='branch-dropdown',
-                                                 clearable=False, style={'color': "#111111", 'verticalAlign': 'bottom',
-                                                                         'margin-left': '5px', 'margin-right': '15px'}),
-                                    dcc.Graph(
-                                        id='graph-plan-completed-branch',
-                                        figure=fig_plan_completed_branch
+                                ], color="warning", outline=False, inverse=True),
+                                width=3,
+                            ),
+                            dbc.Col(
+                                dbc.Card([
+                                    dbc.CardHeader("Просрочено"),
+                                    dbc.CardBody(
+                                        [
+                                            dbc.Row([
+                                                dbc.Col([
+                                                    html.H1(html.B(id="card_expired")),
+                                                ]),
+                                                dbc.Col([
+                                                    dash_table.DataTable(style_data={'whiteSpace': 'normal',
+                                                                                     'height': 'auto',
+                                                                                     },
+                                                                         id='output-data-table-expired',
+                                                                         style_header={'fontWeight': 'bold'},
+                                                                         style_cell={'textAlign': 'center',
+                                                                                     'backgroundColor': 'transparent',
+                                                                                     'color': colors['tabletext'],
+                                                                                     'font_size': '12px',
+                                                                                     'whiteSpace': 'normal',
+                                                                                     'height': 'auto'},
+                                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                                   'name': ['Филиал']},
+                                                                                  {'id': 'Просрочено',
+                                                                                   'name': ['Просрочено']}],
+                                                                         ),
+                                                    dbc.NavLink("Подробнее", id="expired_nav_link", n_clicks=0),
+                                                ])
+                                            ]),
+                                        ]
                                     ),
+                                ], color="danger", outline=False, inverse=True),
+                                width=3,
+                            ),
+                        ]),
+                    ]),
+                    html.Br(),
+                    dbc.Card([
+                        dbc.Tabs(id='tabs', active_tab='year_plan_tab', children=[
+                            dbc.Tab(children=[
+                                dbc.Row([
+                                    dbc.Col([
+                                        dcc.Graph(
+                                            id='graph-plan_compl_year',
+                                        )
+                                    ]),
+                                    dbc.Col([
+                                        dcc.Graph(
+                                            id='graph-year-over-year',
+                                        )
+                                    ]),
+                                ])
+                            ], label="План на год", tab_id="year_plan_tab"),
+                            dbc.Tab([
+                                dbc.Row([
+                                    dbc.Col([
+                                        dcc.Graph(
+                                            id='graph-top_filials',
+                                        ),
+                                    ], align="center"),
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='output-data-table-r12',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[
+                                                                 {'id': 'Ф.И.О. исполнителя',
+                                                                  'name': ['Лидеры', 'Исполнитель']},
+                                                                 {'id': 'Количество', 'name': ['Лидеры', 'Количество']}
+                                                             ]),
+                                    ])
                                 ]),
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='plan_on_date',
-                                                         data=plan_on_date.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                   'name': ['План мониторинга за год',
-                                                                            'Филиал исполнитель ДМОД']},
-                                                                  {'id': 'План',
-                                                                   'name': ['План мониторинга за год', 'План']}
-                                                                  ])
+                            ], label="Лидеры", tab_id="top_tab"),
+                            dbc.Tab(children=[
+                                dbc.Row([
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='output-average-r',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                       'name': ['Среднее время подготовки заключения.',
+                                                                                'Филиал исполнитель ДМОД']},
+                                                                      {'id': 'Время затраченное на заключение Исполнителем',
+                                                                       'name': ['Среднее время подготовки заключения.',
+                                                                                'Время затраченное на заключение Исполнителем']}
+                                                                      ])
+                                    ]),
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='output-average-unique',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[{'id': 'Уникальность обеспечения_',
+                                                                       'name': [
+                                                                           'Среднее время подготовки заключения по категориям.',
+                                                                           'Категория']},
+                                                                      {'id': 'Филиал исполнитель ДМОД_',
+                                                                       'name': [
+                                                                           'Среднее время подготовки заключения по категориям.',
+                                                                           'Филиал исполнитель ДМОД']},
+                                                                      {
+                                                                          'id': 'Время затраченное на заключение Исполнителем_mean',
+                                                                          'name': [
+                                                                              'Среднее время подготовки заключения по категориям.',
+                                                                              'Время затраченное на заключение Исполнителем']}
+                                                                      ])
+                                    ]),
                                 ]),
-                                dbc.Col([
-                                    dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                         id='completed_on_date_id',
-                                                         data=completed_on_date.to_dict('records'),
-                                                         style_header={'backgroundColor': colors['background'],
-                                                                       'padding': '10px',
-                                                                       'fontWeight': 'bold',
-                                                                       'color': colors['tabletext']},
-                                                         style_cell={'textAlign': 'center',
-                                                                     'backgroundColor': colors['background'],
-                                                                     'color': colors['tabletext'],
-                                                                     'font_size': '14px', 'whiteSpace': 'normal',
-                                                                     'height': 'auto'},
-                                                         editable=True,
-                                                         sort_action="native",
-                                                         sort_mode="multi",
-                                                         cell_selectable=True,
-                                                         merge_duplicate_headers=True,
-                                                         columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                                   'name': ['Исполнено объектов мониторинга',
-                                                                            'Филиал исполнитель ДМОД']},
-                                                                  {'id': 'Выполнено',
-                                                                   'name': ['Исполнено объектов мониторинга',
-                                                                            'Исполнено']}
-                                                                  ])
+                                dbc.Row([
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='output-average-f_apr',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[{'id': 'Филиал исполнитель ДМОД_',
+                                                                       'name': [
+                                                                           'Среднее время подготовки согласования заключения',
+                                                                           'Филиал исполнитель ДМОД']},
+                                                                      {
+                                                                          'id': 'Время затраченное на согласование куратором_mean',
+                                                                          'name': [
+                                                                              'Среднее время подготовки согласования заключения',
+                                                                              'Время затраченное на согласование куратором']}
+                                                                      ])
+                                    ]),
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='output-average-f_apr_unique',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[{'id': 'Уникальность обеспечения_',
+                                                                       'name': [
+                                                                           'Среднее время согласования заключения по категориям',
+                                                                           'Уникальность обеспечения']},
+                                                                      {'id': 'Филиал исполнитель ДМОД_',
+                                                                       'name': [
+                                                                           'Среднее время согласования заключения по категориям',
+                                                                           'Филиал исполнитель ДМОД']},
+                                                                      {
+                                                                          'id': 'Время затраченное на согласование куратором_mean',
+                                                                          'name': [
+                                                                              'Среднее время согласования заключения по категориям',
+                                                                              'Время затраченное на согласование куратором']}
+                                                                      ])
+                                    ]),
                                 ]),
-                            ]),
-                        ], label="Исполнено", tab_id="completed_tab"),
-                        dbc.Tab(children=[
-                            dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
-                                                 id='list_expired_id',
-                                                 data=list_expired_branch.to_dict('records'),
-                                                 style_header={'backgroundColor': colors['background'],
-                                                               'padding': '10px',
-                                                               'fontWeight': 'bold',
-                                                               'color': colors['tabletext']},
-                                                 style_cell={'textAlign': 'center',
-                                                             'backgroundColor': colors['background'],
-                                                             'color': colors['tabletext'],
-                                                             'font_size': '14px', 'whiteSpace': 'normal',
-                                                             'height': 'auto'},
-                                                 editable=True,
-                                                 sort_action="native",
-                                                 sort_mode="multi",
-                                                 cell_selectable=True,
-                                                 merge_duplicate_headers=True,
-                                                 columns=[{'id': 'Филиал исполнитель ДМОД',
-                                                           'name': 'Филиал исполнитель ДМОД'},
-                                                          {'id': 'Код объекта залога',
-                                                           'name': 'Код объекта залога'},
-                                                          {'id': 'Класс обеспечения',
-                                                           'name': 'Класс обеспечения', },
-                                                          {'id': 'Наименование заемщика Сцепка',
-                                                           'name': 'Наименование заемщика'},
-                                                          {'id': 'График скорректированный (месяц)',
-                                                           'name': 'Месяц'}
-                                                          ])
-                        ], label='Просрочено', tab_id='expired_tab'),
-                        dbc.Tab(children=[
-                            dcc.Textarea(
-                                id='textarea-example',
-                                value=read_from_note(),
-                                persistence=True, persistence_type='local',
-                                style={'width': '100%', 'height': 300, 'background-color': colors['background'],
-                                       'color': colors['tabletext'], 'margin-left': '0px', 'margin-right': '5px'},
-                            )
-                        ], label="Рекомендации", tab_id="textarea_tab"),
-                    ]),
-                ], color="success", outline=True),
-            ], width=10)
+                            ], label="Среднее время", tab_id="average_time_tab"),
+                            dbc.Tab(children=[
+                                dbc.Row([
+                                    dbc.Col([
+                                        dcc.Graph(
+                                            id='graph-plan-completed',
+                                        ),
+                                    ]),
+                                    dbc.Col([
+                                        dcc.Dropdown([], 'all', id='branch-dropdown',
+                                                     clearable=False, style={'color': "#111111", 'verticalAlign': 'bottom',
+                                                                             'margin-left': '5px', 'margin-right': '15px'}),
+                                        dcc.Graph(
+                                            id='graph-plan-completed-branch',
+                                        ),
+                                    ]),
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='plan_on_date',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                       'name': ['План мониторинга за год',
+                                                                                'Филиал исполнитель ДМОД']},
+                                                                      {'id': 'План',
+                                                                       'name': ['План мониторинга за год', 'План']}
+                                                                      ])
+                                    ]),
+                                    dbc.Col([
+                                        dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                             id='completed_on_date_id',
+                                                             style_header={'backgroundColor': colors['background'],
+                                                                           'padding': '10px',
+                                                                           'fontWeight': 'bold',
+                                                                           'color': colors['tabletext']},
+                                                             style_cell={'textAlign': 'center',
+                                                                         'backgroundColor': colors['background'],
+                                                                         'color': colors['tabletext'],
+                                                                         'font_size': '14px', 'whiteSpace': 'normal',
+                                                                         'height': 'auto'},
+                                                             editable=True,
+                                                             sort_action="native",
+                                                             sort_mode="multi",
+                                                             cell_selectable=True,
+                                                             merge_duplicate_headers=True,
+                                                             columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                                       'name': ['Исполнено объектов мониторинга',
+                                                                                'Филиал исполнитель ДМОД']},
+                                                                      {'id': 'Выполнено',
+                                                                       'name': ['Исполнено объектов мониторинга',
+                                                                                'Исполнено']}
+                                                                      ])
+                                    ]),
+                                ]),
+                            ], label="Исполнено", tab_id="completed_tab"),
+                            dbc.Tab(children=[
+                                dash_table.DataTable(style_data={'whiteSpace': 'normal', 'height': 'auto'},
+                                                     id='list_expired_id',
+                                                     style_header={'backgroundColor': colors['background'],
+                                                                   'padding': '10px',
+                                                                   'fontWeight': 'bold',
+                                                                   'color': colors['tabletext']},
+                                                     style_cell={'textAlign': 'center',
+                                                                 'backgroundColor': colors['background'],
+                                                                 'color': colors['tabletext'],
+                                                                 'font_size': '14px', 'whiteSpace': 'normal',
+                                                                 'height': 'auto'},
+                                                     editable=True,
+                                                     page_action='custom',
+                                                     page_current=0,
+                                                     page_size=EXPIRED_PAGE_SIZE,
+                                                     sort_action='custom',
+                                                     sort_mode="multi",
+                                                     sort_by=[],
+                                                     filter_action='custom',
+                                                     filter_query='',
+                                                     cell_selectable=True,
+                                                     merge_duplicate_headers=True,
+                                                     columns=[{'id': 'Филиал исполнитель ДМОД',
+                                                               'name': 'Филиал исполнитель ДМОД'},
+                                                              {'id': 'Код объекта залога',
+                                                               'name': 'Код объекта залога'},
+                                                              {'id': 'Класс обеспечения',
+                                                               'name': 'Класс обеспечения', },
+                                                              {'id': 'Наименование заемщика Сцепка',
+                                                               'name': 'Наименование заемщика'},
+                                                              {'id': 'График скорректированный (месяц)',
+                                                               'name': 'Месяц'}
+                                                              ])
+                            ], label='Просрочено', tab_id='expired_tab'),
+                            dbc.Tab(children=[
+                                dcc.Textarea(
+                                    id='textarea-example',
+                                    value=read_from_note(),
+                                    persistence=True, persistence_type='local',
+                                    style={'width': '100%', 'height': 300, 'background-color': colors['background'],
+                                           'color': colors['tabletext'], 'margin-left': '0px', 'margin-right': '5px'},
+                                ),
+                                dcc.Store(id='note-saved'),
+                            ], label="Рекомендации", tab_id="textarea_tab"),
+                        ]),
+                    ], color="success", outline=True),
+                ], width=10)
+            ]),
         ]),
-    ]),
-], fluid=True, className="dbc")
+    ], fluid=True, className="dbc")
+
+
+app.layout = serve_layout
 
 
+# ---------------------------------------------------------------------
+#   New snapshot version: checked by timer, "Обновить" asks for a rebuild
+# ---------------------------------------------------------------------
+@app.callback(
+    Output('snapshot-version', 'data'),
+    Input('snapshot-poll', 'n_intervals'),
+    Input('submit-button-state', 'n_clicks'),
+    State('snapshot-version', 'data'),
+    prevent_initial_call=True
+)
+def update_snapshot_version(n_intervals, n_clicks, version):
+    if ctx.triggered_id == 'submit-button-state':
+        request_refresh()
+
+    #   A snapshot built by another server process
+    sync_snapshot()
+    snapshot = get_snapshot()
+    if snapshot['version'] == version:
+        raise PreventUpdate
+    return snapshot['version']
+
+
+# ---------------------------------------------------------------------
+#   Years of the history for the year dropdown
+# ---------------------------------------------------------------------
+@app.callback(
+    Output('year-dropdown', 'options'),
+    Input('snapshot-version', 'data')
+)
+def update_years(version):
+    return history_years()
+
+
+# ---------------------------------------------------------------------
+#   Header: title, pie, categories and the four cards
+# ---------------------------------------------------------------------
 @app.callback(
     Output('output-container-title', 'children'),
     Output('graph-main_plan_completed', 'figure'),
@@ -1563,66 +2758,393 @@ app.layout = dbc.Container([
     Output('output-data-table-remined', 'data'),
     Output('card_expired', 'children'),
     Output('output-data-table-expired', 'data'),
-    Output('tabs', 'active_tab'),
+    Input('snapshot-version', 'data'),
+    Input('filter-dropdown', 'value'),
+    Input('year-dropdown', 'value')
+)
+def update_header(version, main_filter, year):
+    #   After the first call the browser has the figures, only their data are sent
+    return header_outputs(main_filter, year, ctx.triggered_id is not None)
+
+
+@memoize_callback
+def header_outputs(main_filter, year, patch):
+    #   Main filter of dashboard, the snapshot has results for every filter
+    calc = get_view(get_year_snapshot(year), main_filter)
+    figures = calc['figures']
+
+    return calc['date_string_today'], figure_update(figures['fig_main_plan_completed'], patch), \
+           figure_update(figures['fig_mass_unique_interval'], patch), \
+           str(calc['number_plan']), calc['top_plan_branch'].to_dict('records'), \
+           str(calc['number_completed']), calc['top_completed_branch'].to_dict('records'), \
+           str(calc['number_plan'] - calc['number_completed']), calc['top_remained_branch'].to_dict('records'), \
+           str(calc['number_expired']), calc['top_expired_branch'].to_dict('records')
+
+
+# ---------------------------------------------------------------------
+#   Tabs: a tab is loaded when it is opened, and again only if the data, the filter or the year were changed.
+#   The browser keeps the content of the loaded tabs, switching between them does not call the server.
+#   A tab is loaded when the server has sent its content: after an error it is asked again
+# ---------------------------------------------------------------------
+TAB_GRAPH_IDS = [graph for graphs in TAB_GRAPHS.values() for graph in graphs]
+
+app.clientside_callback(
+    """
+    function(active_tab, version, main_filter, year) {
+        var no_update = window.dash_clientside.no_update;
+        var tabs = """ + json.dumps(DATA_TABS) + """;
+        var tab_graphs = """ + json.dumps(TAB_GRAPHS) + """;
+        var graph_ids = """ + json.dumps(TAB_GRAPH_IDS) + """;
+        var loaded = Array.prototype.slice.call(arguments, 4, 4 + tabs.length);
+        var figures = Array.prototype.slice.call(arguments, 4 + tabs.length);
+        var key = JSON.stringify([version, main_filter, year]);
+        var requests = tabs.map(function() { return no_update; });
+        var index = tabs.indexOf(active_tab);
+        if (index < 0 || loaded[index] === key) {
+            return requests;
+        }
+        //  Figures which the browser has get only their data, empty ones (not loaded yet, or an error) all of it
+        var patch = (tab_graphs[active_tab] || []).every(function(graph) {
+            var figure = figures[graph_ids.indexOf(graph)];
+            return Boolean(figure && figure.data && figure.data.length);
+        });
+        requests[index] = {'version': version, 'main_filter': main_filter, 'year': year, 'key': key, 'patch': patch};
+        return requests;
+    }
+    """,
+    *[Output(tab + '-request', 'data') for tab in DATA_TABS],
+    Input('tabs', 'active_tab'),
+    Input('snapshot-version', 'data'),
+    Input('filter-dropdown', 'value'),
+    Input('year-dropdown', 'value'),
+    *[State(tab + '-loaded', 'data') for tab in DATA_TABS],
+    *[State(graph, 'figure') for graph in TAB_GRAPH_IDS]
+)
+
+
+@app.callback(
     Output('graph-plan_compl_year', 'figure'),
+    Output('graph-year-over-year', 'figure'),
+    Output('year_plan_tab-loaded', 'data'),
+    Input('year_plan_tab-request', 'data'),
+    prevent_initial_call=True
+)
+@memoize_callback
+def update_year_plan_tab(request):
+    if request is None:
+        raise PreventUpdate
+    calc = get_tab_view(get_year_snapshot(request['year']), 'year_plan_tab', request['main_filter'])
+    return figure_update(calc['fig_plan_compl_year'], request.get('patch')), \
+           make_fig_year_over_year(year_over_year(request['main_filter']), colors), request.get('key')
+
+
+@app.callback(
     Output('graph-top_filials', 'figure'),
     Output('output-data-table-r12', 'data'),
+    Output('top_tab-loaded', 'data'),
+    Input('top_tab-request', 'data'),
+    prevent_initial_call=True
+)
+@memoize_callback
+def update_top_tab(request):
+    if request is None:
+        raise PreventUpdate
+    calc = get_tab_view(get_year_snapshot(request['year']), 'top_tab', request['main_filter'])
+    return figure_update(calc['fig_top_filials'], request.get('patch')), \
+           calc['df_top_leaders'].to_dict('records'), request.get('key')
+
+
+@app.callback(
     Output('output-average-r', 'data'),
     Output('output-average-unique', 'data'),
     Output('output-average-f_apr', 'data'),
     Output('output-average-f_apr_unique', 'data'),
+    Output('average_time_tab-loaded', 'data'),
+    Input('average_time_tab-request', 'data'),
+    prevent_initial_call=True
+)
+@memoize_callback
+def update_average_time_tab(request):
+    if request is None:
+        raise PreventUpdate
+    calc = get_tab_view(get_year_snapshot(request['year']), 'average_time_tab', request['main_filter'])
+    return format_average(calc['df_average_filials_r']).to_dict('records'), \
+           format_average(calc['df_average_filials_unique']).to_dict('records'), \
+           format_average(calc['df_average_f_apr_r']).to_dict('records'), \
+           format_average(calc['df_average_f_apr_unique']).to_dict('records'), request.get('key')
+
+
+@app.callback(
     Output('plan_on_date', 'data'),
     Output('graph-plan-completed', 'figure'),
     Output('branch-dropdown', 'options'),
-    Output('graph-plan-completed-branch', 'figure'),
     Output('completed_on_date_id', 'data'),
+    Output('completed_tab-loaded', 'data'),
+    Input('completed_tab-request', 'data'),
+    prevent_initial_call=True
+)
+@memoize_callback
+def update_completed_tab(request):
+    if request is None:
+        raise PreventUpdate
+    calc = get_tab_view(get_year_snapshot(request['year']), 'completed_tab', request['main_filter'])
+    return calc['plan_on_date'].to_dict('records'), figure_update(calc['fig_plan_completed'], request.get('patch')), \
+           calc['df_list_branch'], calc['completed_on_date'].to_dict('records'), request.get('key')
+
+
+@app.callback(
+    Output('graph-plan-completed-branch', 'figure'),
+    Input('completed_tab-request', 'data'),
+    Input('branch-dropdown', 'value'),
+    prevent_initial_call=True
+)
+def update_branch(request, branch_filter):
+    if request is None:
+        raise PreventUpdate
+    return branch_outputs(request, branch_filter, request.get('patch') or ctx.triggered_id == 'branch-dropdown')
+
+
+@memoize_callback
+def branch_outputs(request, branch_filter, patch):
+    calc = get_tab_view(get_year_snapshot(request['year']), 'completed_tab', request['main_filter'])
+    if branch_filter == "all":
+        return figure_update(calc['fig_plan_completed_branch'], patch)
+    return figure_update(make_fig_plan_completed_branch(*calc_branch(calc, branch_filter), colors), patch)
+
+
+@app.callback(
     Output('list_expired_id', 'data'),
-    Input('tabs', 'active_tab'),
-    Input('submit-button-state', 'n_clicks'),
+    Output('list_expired_id', 'page_count'),
+    Output('list_expired_id', 'page_current'),
+    Output('expired_tab-loaded', 'data'),
+    Input('expired_tab-request', 'data'),
+    Input('list_expired_id', 'page_current'),
+    Input('list_expired_id', 'page_size'),
+    Input('list_expired_id', 'sort_by'),
+    Input('list_expired_id', 'filter_query'),
+    prevent_initial_call=True
+)
+def update_expired_tab(request, page_current, page_size, sort_by, filter_query):
+    if request is None:
+        raise PreventUpdate
+
+    #   Only one page goes to the browser
+    df_expired = query_expired(get_year_snapshot(request['year']), request['main_filter'], sort_by, filter_query)
+    page_size = page_size or EXPIRED_PAGE_SIZE
+    page_count = max(1, -(-len(df_expired) // page_size))
+
+    #   Other data, filter or sorting start from the first page, a page past the end is the last one
+    if 'list_expired_id.page_current' not in ctx.triggered_prop_ids:
+        page_current = 0
+    page_current = min(page_current or 0, page_count - 1)
+    return (df_expired.iloc[page_current * page_size: (page_current + 1) * page_size].to_dict('records'), page_count,
+            page_current, request.get('key'))
+
+
+# ---------------------------------------------------------------------
+#   Process link to expired cases list (in the browser)
+# ---------------------------------------------------------------------
+app.clientside_callback(
+    """
+    function(nav_clicks) {
+        return 'expired_tab';
+    }
+    """,
+    Output('tabs', 'active_tab'),
     Input('expired_nav_link', 'n_clicks'),
+    prevent_initial_call=True
+)
+
+
+@app.callback(
+    Output('note-saved', 'data'),
     Input('textarea-example', 'value'),
-    Input('filter-dropdown', 'value'),
-    Input('branch-dropdown', 'value')
+    prevent_initial_call=True
 )
-def update_output(active_tab_, n_clicks, nav_clicks, value, main_filter, branch_filter):
+def save_note(value):
     #   encode text for Linux
     # value = value.encode()
 
-    #   Write text from Textarea to file note.txt
-    write_to_note(format(value))
+    #   Write text from Textarea to file note.txt, when the user stops typing
+    schedule_note_save(value or '')
+    return datetime.now().strftime('%d.%m.%Y %H:%M:%S')
+
+
+# ---------------------------------------------------------------------
+#   Metrics of callbacks (time and size of the response) and the route /metrics
+# ---------------------------------------------------------------------
+@app.server.before_request
+def metrics_request_start():
+    flask.g.metrics_start = time.perf_counter()
+
+
+@app.server.after_request
+def metrics_request_end(response):
+    if flask.request.path.endswith('_dash-update-component') and 'metrics_start' in flask.g:
+        seconds = time.perf_counter() - flask.g.metrics_start
+        output = (flask.request.get_json(silent=True) or {}).get('output', '')
+        callback = app.callback_map.get(output, {}).get('callback')
+        name = getattr(callback, '__name__', output)
+        size = response.calculate_content_length() or 0
+        prevented = response.status_code == 204
+        record_callback(name, seconds, size, prevented)
+        if METRICS_LOG_CALLBACKS:
+            print(json.dumps({'time': datetime.now().isoformat(timespec='milliseconds'), 'callback': name,
+                              'seconds': round(seconds, 4), 'bytes': size, 'status': response.status_code,
+                              'prevented': prevented}, ensure_ascii=False))
+    return response
+
+
+def metric_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metrics_text():
+    lines = []
+
+    def family(name, kind, text, values):
+        lines.append('# HELP ' + name + ' ' + text)
+        lines.append('# TYPE ' + name + ' ' + kind)
+        for labels, value in values:
+            label = ','.join(key + '="' + metric_label(item) + '"' for key, item in labels.items())
+            lines.append(name + ('{' + label + '}' if label else '') + ' ' + repr(float(value)))
+
+    with metrics_lock:
+        stages = {name: dict(metrics) for name, metrics in stage_metrics.items()}
+        callbacks = {name: dict(metrics) for name, metrics in callback_metrics.items()}
+        redraws = {name: dict(metrics) for name, metrics in redraw_metrics.items()}
+    with source_cache_lock:
+        cache = dict(source_cache_stats)
+    with csv_export_lock:
+        export = dict(csv_export_stats)
+    with callback_cache_lock:
+        memo = dict(callback_cache_stats)
+    snapshot = current_snapshot
+
+    for key, kind, text in [('calls', 'counter', 'Calls of the calculation stage'),
+                            ('seconds', 'counter', 'Time spent in the calculation stage'),
+                            ('last_seconds', 'gauge', 'Time of the last call of the calculation stage'),
+                            ('rows_in', 'counter', 'Rows of the input dataframe'),
+                            ('rows_out', 'counter', 'Rows of the result')]:
+        suffix = '' if kind == 'gauge' else '_total'
+        family('dashboard_stage_' + key + suffix, kind, text,
+               [({'stage': name}, metrics[key]) for name, metrics in sorted(stages.items())])
+    for key, kind, text in [('calls', 'counter', 'Calls of the callback'),
+                            ('prevented', 'counter', 'Calls of the callback without update'),
+                            ('seconds', 'counter', 'Time of the callback requests'),
+                            ('last_seconds', 'gauge', 'Time of the last callback request'),
+                            ('bytes', 'counter', 'Bytes of the callback responses'),
+                            ('last_bytes', 'gauge', 'Bytes of the last callback response')]:
+        suffix = '' if kind == 'gauge' else '_total'
+        family('dashboard_callback_' + key + suffix, kind, text,
+               [({'callback': name}, metrics[key]) for name, metrics in sorted(callbacks.items())])
+
+    for key, kind, text in [('calls', 'counter', 'Figures drawn in the browsers'),
+                            ('seconds', 'counter', 'Time of drawing of the figures in the browsers'),
+                            ('last_seconds', 'gauge', 'Time of the last drawing of the figure')]:
+        suffix = '' if kind == 'gauge' else '_total'
+        family('dashboard_redraw_' + key + suffix, kind, text,
+               [({'graph': name}, metrics[key]) for name, metrics in sorted(redraws.items())])
+
+    family('dashboard_source_cache_hits_total', 'counter', 'Workbooks taken from the source cache',
+           [({}, cache['hits'])])
+    family('dashboard_source_cache_misses_total', 'counter', 'Workbooks parsed', [({}, cache['misses'])])
+    family('dashboard_source_parse_seconds_total', 'counter', 'Time of parsing of the workbooks',
+           [({}, cache['parse_time'])])
+    family('dashboard_callback_cache_total', 'counter', 'Callback results taken from the cache or calculated',
+           [({'result': result}, memo[result]) for result in ('hits', 'shared_hits', 'misses')])
+    family('dashboard_csv_export_total', 'counter', 'Exports of the CSV file',
+           [({'result': result}, export[result]) for result in ('written', 'skipped', 'failed')])
+    family('dashboard_csv_export_last_seconds', 'gauge', 'Time of the last export of the CSV file',
+           [({}, export['last_export_time'])])
+    family('dashboard_snapshot_version', 'gauge', 'Version of the current snapshot',
+           [({}, snapshot['version'] if snapshot is not None else 0)])
+    return '\n'.join(lines) + '\n'
+
+
+@app.server.route('/metrics')
+def metrics():
+    return flask.Response(metrics_text(), mimetype='text/plain; version=0.0.4')
+
+
+@app.server.route('/metrics/redraw', methods=['POST'])
+def metrics_redraw():
+    #   Sent by assets/redraw_timing.js
+    try:
+        for redraw in json.loads(flask.request.get_data(as_text=True))[:1000]:
+            record_redraw(str(redraw['graph']), float(redraw['seconds']))
+    except (ValueError, KeyError, TypeError):
+        return flask.Response(status=400)
+    return flask.Response(status=204)
+
+
+# --------------------------------------------------------------------------------------------------------------------
+#   Production server: gunicorn with several processes, or waitress with threads (on Windows too).
+#   The debugger and the reloader are off
+# --------------------------------------------------------------------------------------------------------------------
+SERVER_WORKERS = 4
+SERVER_THREADS = 8
+SERVER_TIMEOUT = 600  # seconds, the first snapshot of a worker may take long
+
+#   WSGI application, for "gunicorn dashboard:server" or "waitress-serve dashboard:server"
+server = app.server
 
-    #   Main filter of dashboard, according this filter make calculations
-    if main_filter == "branch":
-        make_calc("branch", branch_filter)
-    elif main_filter == "almaty":
-        make_calc("almaty", branch_filter)
+
+def warm_snapshot():
+    #   Build the first snapshot before the server accepts requests. If the files can't be read the server starts
+    #   anyway, the snapshot is built again by the first request
+    try:
+        get_snapshot()
+    except Exception as e:
+        print(e)
+        print("Данные не загружены, они будут загружены при первом запросе")
+
+
+def run_production(host, port, workers, threads):
+    global SNAPSHOT_SHARED, CALLBACK_CACHE_DIR
+
+    if workers > 1 and gunicorn_base is not None:
+        #   The workers share the snapshot and the results of callbacks through the cache folder,
+        #   the first one builds the snapshot
+        SNAPSHOT_SHARED = True
+        CALLBACK_CACHE_DIR = os.path.join(JORNAL_CACHE_DIR, 'callbacks')
+        options = {'bind': host + ':' + str(port), 'workers': workers, 'threads': threads,
+                   'timeout': SERVER_TIMEOUT, 'post_worker_init': lambda worker: warm_snapshot()}
+
+        class DashboardServer(gunicorn_base.BaseApplication):
+            def load_config(self):
+                for key, value in options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return server
+
+        DashboardServer().run()
+    elif waitress is not None:
+        warm_snapshot()
+        waitress.serve(server, host=host, port=port, threads=threads)
     else:
-        make_calc("all", branch_filter)
-
-    #   Process link to expired cases list
-    if "expired_nav_link" == ctx.triggered_id:
-        active_tab_ = 'expired_tab'
-
-    #   Make graphs, histograms
-    prepare_fig(colors)
-
-    return date_string_today, fig_main_plan_completed, fig_mass_unique_interval, \
-           str(number_plan), top_plan_branch.to_dict('records'), \
-           str(number_completed), top_completed_branch.to_dict('records'), \
-           str(number_plan - number_completed), top_remained_branch.to_dict('records'), str(number_expired), \
-           top_expired_branch.to_dict('records'), active_tab_, \
-           fig_plan_compl_year, fig_top_filials, \
-           df_top_leaders.to_dict('records'), \
-           df_average_filials_r.to_dict('records'), \
-           df_average_filials_unique.to_dict('records'), \
-           df_average_f_apr_r.to_dict('records'), \
-           df_average_f_apr_unique.to_dict('records'), plan_on_date.to_dict('records'), \
-           fig_plan_completed, df_list_branch, fig_plan_completed_branch, completed_on_date.to_dict('records'), \
-           list_expired_branch.to_dict('records')
+        print("Neither gunicorn nor waitress is installed (pip install waitress), the debug server is used")
+        warm_snapshot()
+        app.run_server(debug=False, port=str(port), host=host)
 
 
 # --------------------------------------------------------------------------------------------------------------------
 #   Main part
 # --------------------------------------------------------------------------------------------------------------------
 if __name__ == '__main__':
-    app.run_server(debug=True, port='8000', host='0.0.0.0')
+    parser = argparse.ArgumentParser(description='Dashboard of the Monitoring plan')
+    parser.add_argument('--production', action='store_true', help='gunicorn or waitress, debug is off')
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='server processes (gunicorn)')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='threads of a server process')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.production:
+        run_production(args.host, args.port, args.workers, args.threads)
+    else:
+        #   Only in the process which serves: the reloader process does not read the data and runs no threads
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            warm_snapshot()
+        app.run_server(debug=True, port=str(args.port), host=args.host)